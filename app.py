@@ -1,16 +1,42 @@
-from flask import Flask, render_template, abort, request, send_file
+from flask import Flask, render_template, abort, request, send_file, jsonify, Response, stream_with_context, redirect, url_for
+from flask import before_render_template, template_rendered, request_started
 import os
-import markdown
 import re
 import io
-from collections import Counter, defaultdict
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import base64
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from contextlib import contextmanager
 import random
+import math
+import click
+import threading
+import queue
+import time
+import hashlib
+import hmac
+import base64
+import zlib
+import uuid
+import datetime
+from functools import lru_cache
+from array import array
+import json
+import tarfile
+import tempfile
+import zipfile
+import bisect
+import gzip
+import shutil
+import mimetypes
+import subprocess
+import sys
+from werkzeug.security import safe_join
+from markupsafe import Markup, escape
 
 app = Flask(__name__)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # project data stored in a dictionary
 PROJECTS = {
@@ -243,18 +269,436 @@ PROJECTS = {
 def inject_projects():
     return dict(projects=PROJECTS)
 
+# === Instrumentation ===
+# Cheap enough to leave on: a stage() is one histogram observation, and a request's
+# stages go out in its Server-Timing header. /metrics serves everything in the
+# Prometheus text format. With PORTFOLIO_PROFILE_SLOW_MS set, a sampling profiler
+# watches requests and jobs and writes folded stacks (for flamegraph.pl/speedscope)
+# for any that take longer.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256 B .. 64 MiB
+COUNT_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+GROUP_BUCKETS = (3, 5, 10, 20, 30, 50, 100)
+PROFILE_SLOW_MS = int(os.environ.get("PORTFOLIO_PROFILE_SLOW_MS", "0"))  # 0 turns the profiler off
+PROFILE_INTERVAL = 0.005
+PROFILE_FOLDER = os.path.join(BASE_DIR, "profiles")
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class Metrics:
+    def __init__(self):
+        self.families = {}  # name -> (type, help, buckets)
+        self.series = {}  # (name, labels) -> Histogram or a counter value
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self.families[name] = (kind, help_text, buckets)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.series.get(key)
+            if histogram is None:
+                histogram = self.series[key] = Histogram(self.families[name][2])
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def collector(self, fn):
+        # fn() yields (name, labels, value) for numbers that live elsewhere, read at scrape time
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        with self.lock:
+            series = {key: (list(value.counts), value.sum) if isinstance(value, Histogram) else value
+                      for key, value in self.series.items()}
+        for fn in self.collectors:
+            for name, labels, value in fn():
+                series[(name, tuple(sorted(labels.items())))] = value
+        lines = []
+        for name in sorted(self.families):
+            kind, help_text, buckets = self.families[name]
+            keys = sorted(key for key in series if key[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in keys:
+                labels = key[1]
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {series[key]}")
+                    continue
+                counts, total = series[key]
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+perf_metrics = Metrics()
+perf_metrics.describe("portfolio_request_seconds", "histogram", "Time spent in the Flask app per request.",
+                      LATENCY_BUCKETS)
+perf_metrics.describe("portfolio_requests_total", "counter", "Requests handled by the Flask app.")
+perf_metrics.describe("portfolio_cached_response_seconds", "histogram",
+                      "Time to answer a request from the response cache.", LATENCY_BUCKETS)
+perf_metrics.describe("portfolio_stage_seconds", "histogram", "Time spent in each instrumented stage.",
+                      LATENCY_BUCKETS)
+perf_metrics.describe("portfolio_job_seconds", "histogram", "Demo job run time.", LATENCY_BUCKETS)
+perf_metrics.describe("portfolio_job_queue_seconds", "histogram", "Time demo jobs waited for a worker.",
+                      LATENCY_BUCKETS)
+perf_metrics.describe("portfolio_request_bytes", "histogram", "Request body sizes.", BYTES_BUCKETS)
+perf_metrics.describe("portfolio_response_bytes", "histogram", "Response body sizes (unstreamed only).",
+                      BYTES_BUCKETS)
+perf_metrics.describe("portfolio_upload_bytes", "histogram", "Sizes of texts uploaded to the hapax demo.",
+                      BYTES_BUCKETS)
+perf_metrics.describe("portfolio_hapax_tokens", "histogram", "Words per analyzed text.", COUNT_BUCKETS)
+perf_metrics.describe("portfolio_secret_santa_group_size", "histogram", "Secret Santa group sizes.",
+                      GROUP_BUCKETS)
+perf_metrics.describe("portfolio_cache_hits_total", "counter", "Cache hits.")
+perf_metrics.describe("portfolio_cache_misses_total", "counter", "Cache misses.")
+perf_metrics.describe("portfolio_cache_bytes", "gauge", "Bytes held by each in-memory cache.")
+perf_metrics.describe("portfolio_jobs", "gauge", "Demo jobs currently tracked, by status.")
+perf_metrics.describe("portfolio_fact_queue", "gauge", "Facts ready in the provider's queue.")
+perf_metrics.describe("portfolio_profiles_written_total", "counter", "Slow-request profiles written.")
+
+# stages land in the current request's (or job's) list when there is one
+request_timing = threading.local()
+
+def record_stage(name, seconds, detail=None):
+    perf_metrics.observe("portfolio_stage_seconds", seconds, stage=name)
+    stages = getattr(request_timing, "stages", None)
+    if stages is not None:
+        stages.append((name, detail, seconds))
+
+@contextmanager
+def stage(name, detail=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, detail)
+
+def server_timing(stages, total=None):
+    merged = OrderedDict()
+    for name, detail, seconds in stages:
+        merged[(name, detail)] = merged.get((name, detail), 0.0) + seconds
+    parts = [f'{name};desc="{detail}";dur={seconds * 1000:.1f}' if detail else f"{name};dur={seconds * 1000:.1f}"
+             for (name, detail), seconds in merged.items()]
+    if total is not None:
+        parts.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms, interval=PROFILE_INTERVAL, folder=PROFILE_FOLDER):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.folder = folder
+        self.active = {}  # thread id -> Counter of folded stacks
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        with self.lock:
+            self.active[threading.get_ident()] = Counter()
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.sample, name="slow-request-profiler", daemon=True)
+                self.thread.start()
+        self.wake.set()
+
+    def sample(self):
+        while True:
+            with self.lock:
+                if not self.active:
+                    self.wake.clear()
+            self.wake.wait()  # parked while nothing is being watched
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[fold_stack(frame)] += 1
+
+    def stop(self, seconds, label):
+        with self.lock:
+            stacks = self.active.pop(threading.get_ident(), None)
+        if not stacks or seconds < self.threshold:
+            return None
+        os.makedirs(self.folder, exist_ok=True)
+        slug = re.sub(r"[^\w.-]+", "_", label).strip("_") or "root"
+        path = os.path.join(self.folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms-{slug}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        perf_metrics.inc("portfolio_profiles_written_total")
+        return path
+
+def fold_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_MS) if PROFILE_SLOW_MS > 0 else None
+
+@request_started.connect_via(app)
+def start_request_timing(sender, **extra):
+    request_timing.stages = []
+    request_timing.templates = []
+    request_timing.started = time.perf_counter()
+    # the response cache reads this back to label its hits
+    request.environ["portfolio.route"] = request.url_rule.rule if request.url_rule else "unmatched"
+    if profiler:
+        profiler.start()
+
+@before_render_template.connect_via(app)
+def start_template_timing(sender, template, context, **extra):
+    templates = getattr(request_timing, "templates", None)
+    if templates is not None:
+        templates.append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def finish_template_timing(sender, template, context, **extra):
+    templates = getattr(request_timing, "templates", None)
+    if templates:
+        record_stage("template", time.perf_counter() - templates.pop(), template.name)
+
+@app.after_request
+def add_server_timing(response):
+    started = getattr(request_timing, "started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.environ["portfolio.route"]
+    perf_metrics.observe("portfolio_request_seconds", elapsed, route=route, method=request.method)
+    perf_metrics.inc("portfolio_requests_total", route=route, method=request.method,
+                     status=str(response.status_code))
+    if request.content_length:
+        perf_metrics.observe("portfolio_request_bytes", request.content_length, route=route)
+    if not response.is_streamed and response.content_length is not None:
+        perf_metrics.observe("portfolio_response_bytes", response.content_length, route=route)
+    response.headers.add("Server-Timing", server_timing(request_timing.stages, elapsed))
+    return response
+
+@app.teardown_request
+def finish_request_timing(exc):
+    started = getattr(request_timing, "started", None)
+    request_timing.stages = request_timing.templates = request_timing.started = None
+    if profiler and started is not None:
+        profiler.stop(time.perf_counter() - started, f"{request.method} {request.path}")
+
+@perf_metrics.collector
+def collect_app_state():
+    caches = {"response": response_cache.cache, "fod": fod_render_cache, "secret_santa": secret_santa_cache}
+    for name, cache in caches.items():
+        yield "portfolio_cache_hits_total", {"cache": name}, cache.hits
+        yield "portfolio_cache_misses_total", {"cache": name}, cache.misses
+        yield "portfolio_cache_bytes", {"cache": name}, cache.size
+    statuses = jobs.counts()
+    for status in ("queued", "running", "done", "failed", "cancelled", "timeout"):
+        yield "portfolio_jobs", {"status": status}, statuses.get(status, 0)
+    yield "portfolio_fact_queue", {}, fact_provider.facts.qsize()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    response = Response(perf_metrics.render(), mimetype="text/plain; version=0.0.4")
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+# === Static asset fingerprints ===
+# url_for('static', ...) gets ?v=<content hash>, so a changed file gets a new URL and
+# old ones can be cached forever.
+_static_hashes = {}
+
+def static_fingerprint(filename):
+    path = safe_join(app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+    cached = _static_hashes.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as f:
+            cached = (mtime, hashlib.sha1(f.read()).hexdigest()[:10])
+        _static_hashes[filename] = cached
+    return cached[1]
+
+@app.url_defaults
+def add_static_fingerprint(endpoint, values):
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        fingerprint = static_fingerprint(values["filename"])
+        if fingerprint:
+            values["v"] = fingerprint
+
+# === Responsive media ===
+# `flask build-media` writes resized WebP/AVIF copies of every screenshot (and a
+# poster frame per video, when ffmpeg is around) into static/derived, named by
+# content hash, plus a manifest the templates use for srcset. Unchanged sources
+# are skipped, so rebuilding is incremental.
+MEDIA_SOURCES = {"images": (".png", ".jpg", ".jpeg"), "videos": (".mp4", ".webm")}
+MEDIA_DERIVED_DIR = os.path.join(app.static_folder, "derived")
+MEDIA_MANIFEST_PATH = os.path.join(MEDIA_DERIVED_DIR, "manifest.json")
+MEDIA_WIDTHS = (320, 640, 1024, 1600)
+MEDIA_FORMATS = {"avif": {"quality": 55}, "webp": {"quality": 80, "method": 6}}
+MEDIA_SIZES = "(max-width: 900px) 100vw, 900px"
+POSTER_WIDTH = 1280
+
+_media_manifest = {"mtime": None, "entries": {}}
+
+def media_manifest():
+    try:
+        mtime = os.path.getmtime(MEDIA_MANIFEST_PATH)
+    except OSError:
+        return {}
+    if mtime != _media_manifest["mtime"]:
+        with open(MEDIA_MANIFEST_PATH, encoding="utf-8") as f:
+            _media_manifest["entries"] = json.load(f)
+        _media_manifest["mtime"] = mtime
+    return _media_manifest["entries"]
+
+@app.context_processor
+def inject_media():
+    return dict(media=media_manifest(), media_sizes=MEDIA_SIZES)
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+def derived_url(name):
+    return f"/static/derived/{name}"
+
+def build_image_derivatives(path, stem, digest):
+    from PIL import Image, features
+    entry = {"hash": digest, "sources": {}}
+    with Image.open(path) as source:
+        source.load()
+        entry["width"], entry["height"] = source.size
+        widths = [w for w in MEDIA_WIDTHS if w < source.width] + [source.width]
+        image = source.convert("RGBA" if source.mode in ("RGBA", "LA", "P") else "RGB")
+    for fmt, options in MEDIA_FORMATS.items():
+        if not features.check(fmt):
+            continue  # e.g. Pillow built without libavif
+        srcset = []
+        for width in widths:
+            name = f"{stem}-{digest}-{width}.{fmt}"
+            target = os.path.join(MEDIA_DERIVED_DIR, name)
+            if not os.path.exists(target):
+                resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+                resized.save(target, format=fmt.upper(), **options)
+            srcset.append({"src": derived_url(name), "width": width})
+        entry["sources"][fmt] = srcset
+    return entry
+
+def build_video_poster(path, stem, digest):
+    entry = {"hash": digest}
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return entry
+    name = f"{stem}-{digest}-poster.jpg"
+    target = os.path.join(MEDIA_DERIVED_DIR, name)
+    if not os.path.exists(target):
+        subprocess.run([ffmpeg, "-loglevel", "error", "-y", "-ss", "1", "-i", path, "-frames:v", "1",
+                        "-vf", f"scale='min({POSTER_WIDTH},iw)':-2", target], check=True)
+    entry["poster"] = derived_url(name)
+    return entry
+
+def derived_outputs(entry):
+    names = [entry["poster"].rsplit("/", 1)[1]] if "poster" in entry else []
+    for srcset in entry.get("sources", {}).values():
+        names.extend(item["src"].rsplit("/", 1)[1] for item in srcset)
+    return names
+
+def media_entry_complete(folder, entry):
+    # an unchanged source is only skipped once everything it should produce exists
+    if folder == "videos":
+        if "poster" not in entry and shutil.which("ffmpeg"):
+            return False  # built before ffmpeg was installed
+    else:
+        from PIL import features
+        if any(fmt not in entry.get("sources", {}) for fmt in MEDIA_FORMATS if features.check(fmt)):
+            return False
+    return all(os.path.exists(os.path.join(MEDIA_DERIVED_DIR, name)) for name in derived_outputs(entry))
+
+@app.cli.command("build-media")
+def build_media():
+    os.makedirs(MEDIA_DERIVED_DIR, exist_ok=True)
+    manifest = dict(media_manifest())
+    updated = {}
+    for folder, extensions in MEDIA_SOURCES.items():
+        folder_path = os.path.join(app.static_folder, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            if not name.lower().endswith(extensions):
+                continue
+            path = os.path.join(folder_path, name)
+            url = f"/static/{folder}/{name}"
+            digest = file_digest(path)
+            if manifest.get(url, {}).get("hash") == digest and media_entry_complete(folder, manifest[url]):
+                updated[url] = manifest[url]
+                continue
+            stem = os.path.splitext(name)[0]
+            if folder == "videos":
+                updated[url] = build_video_poster(path, stem, digest)
+                if "poster" not in updated[url]:
+                    click.echo(f"ffmpeg not found, no poster for {url}", err=True)
+            else:
+                updated[url] = build_image_derivatives(path, stem, digest)
+            click.echo(f"built {url}")
+    # drop derivatives that no manifest entry points at any more
+    referenced = {os.path.basename(MEDIA_MANIFEST_PATH)}
+    for entry in updated.values():
+        referenced.update(derived_outputs(entry))
+    for name in os.listdir(MEDIA_DERIVED_DIR):
+        if name not in referenced:
+            os.remove(os.path.join(MEDIA_DERIVED_DIR, name))
+    tmp_path = MEDIA_MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(updated, f, indent=1)
+    os.replace(tmp_path, MEDIA_MANIFEST_PATH)
+    click.echo(f"{len(updated)} media entries in {MEDIA_MANIFEST_PATH}")
+
 @app.route('/')
 def index():
     return render_template('index.html', title="The KonnerVerse")
 
-def exact_ordered_distribution(n):
+def exact_ordered_distribution(n, excluded=None):
     results = defaultdict(float)
     def recurse(i, remaining, assigned, prob):
         if i == n:
             perm = tuple(assigned)
             results[perm] += prob
             return
-        possible = [r for r in remaining if r != i]
+        possible = [r for r in remaining if r != i and (excluded is None or not excluded[i][r])]
         for pick in possible:
             new_remaining = remaining.copy()
             new_remaining.remove(pick)
@@ -263,33 +707,1423 @@ def exact_ordered_distribution(n):
     recurse(0, list(range(n)), [], 1.0)
     return results
 
-def probability_matrix(n, monte_carlo_trials=100000):
-    if n < 10:
-        dist = exact_ordered_distribution(n)
-        matrix = [[0.0]*n for _ in range(n)]
-        total_prob = sum(dist.values())
-        for perm, p in dist.items():
-            for i in range(n):
-                matrix[i][perm[i]] += p / total_prob
-        return matrix
+# === Exact Secret Santa engine (subset DP) ===
+# State is (giver i, bitmask of receivers still in the hat). Every mask at level i
+# has popcount n - i, so each level is processed in vectorized chunks, one receiver
+# bit at a time, which keeps the working set at a few arrays of EXACT_CHUNK masks.
+EXACT_MAX_N = 22
+EXACT_CHUNK = 1 << 16
+
+def _popcounts(n):
+    import numpy as np
+    pc = np.zeros(1 << n, dtype=np.int8)
+    for b in range(n):
+        pc[1 << b:1 << (b + 1)] = pc[:1 << b] + 1
+    return pc
+
+@lru_cache(maxsize=2)
+def _masks_by_level(n):
+    import numpy as np
+    pc = _popcounts(n)
+    order = np.argsort(pc, kind="stable").astype(np.uint32)
+    bounds = np.searchsorted(pc[order], np.arange(n + 2))
+    levels = tuple(order[bounds[n - i]:bounds[n - i + 1]] for i in range(n + 1))
+    for masks in levels:
+        masks.flags.writeable = False  # shared between calls
+    return levels
+
+# === Exclusion constraints ===
+# excluded[i][j] = True means giver i may not draw j (partners, last year's pairing).
+# Drawing yourself is always excluded.
+def allowed_matrix(n, excluded=None):
+    import numpy as np
+    allowed = ~np.eye(n, dtype=bool)
+    if excluded is not None:
+        allowed &= ~np.asarray(excluded, dtype=bool)
+    return allowed
+
+def has_perfect_matching(allowed):
+    import numpy as np
+    # Kuhn's augmenting paths: the hat can only finish if every giver can be matched
+    n = len(allowed)
+    match = [-1] * n
+    def augment(i, seen):
+        for r in np.flatnonzero(allowed[i]):
+            if not seen[r]:
+                seen[r] = True
+                if match[r] < 0 or augment(match[r], seen):
+                    match[r] = i
+                    return True
+        return False
+    return all(augment(i, [False] * n) for i in range(n))
+
+def exact_probability_matrix(n, excluded=None, check=None):
+    import numpy as np
+    if n < 2:
+        return [[0.0]*n for _ in range(n)]
+    levels = _masks_by_level(n)
+    allowed = allowed_matrix(n, excluded)
+    receivers = [[(j, np.uint32(1 << j)) for j in np.flatnonzero(allowed[i])] for i in range(n)]
+
+    def chunks(i):
+        # (masks, has-bit per allowed receiver, number of allowed receivers left)
+        for start in range(0, len(levels[i]), EXACT_CHUNK):
+            masks = levels[i][start:start + EXACT_CHUNK]
+            has = [(j, bit, (masks & bit) != 0) for j, bit in receivers[i]]
+            k = np.zeros(len(masks), dtype=np.int8)
+            for _, _, h in has:
+                k += h
+            yield masks, has, k
+
+    # backward pass: chance of finishing the draw without a dead end from each state
+    finish = np.zeros(1 << n)
+    finish[0] = 1.0
+    for i in range(n - 1, -1, -1):
+        if check:
+            check()  # once per level, so a job can be cancelled mid-DP
+        for masks, has, k in chunks(i):
+            total = np.zeros(len(masks))
+            for _, bit, h in has:
+                total += h * finish[masks ^ bit]
+            finish[masks] = np.divide(total, k, out=np.zeros(len(masks)), where=k > 0)
+
+    success = finish[(1 << n) - 1]
+    if success == 0:
+        return [[0.0]*n for _ in range(n)]
+
+    # forward pass: chance of reaching each state, accumulating giver->receiver marginals
+    reach = np.zeros(1 << n)
+    reach[(1 << n) - 1] = 1.0
+    matrix = np.zeros((n, n))
+    for i in range(n):
+        if check:
+            check()
+        for masks, has, k in chunks(i):
+            share = np.divide(reach[masks], k, out=np.zeros(len(masks)), where=k > 0)
+            for j, bit, h in has:
+                step = h * share
+                nxt = masks ^ bit  # distinct per mask, so a plain += can't collide
+                matrix[i, j] += (step * finish[nxt]).sum()
+                reach[nxt] += step
+
+    # condition on draws that didn't dead-end (same as the enumerated distribution)
+    return (matrix / success).tolist()
+
+# === Process pools ===
+# Pools start on first use and are spawned, not forked: they can start from job or
+# request threads while other threads hold locks. One dead child (OOM, segfault)
+# breaks a pool for good, so the broken one is dropped and the next caller gets a
+# fresh pool.
+class LazyPool:
+    def __init__(self, max_workers, **kwargs):
+        self.max_workers = max_workers
+        self.kwargs = kwargs
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context("spawn"), **self.kwargs)
+            return self.pool
+
+    def discard(self, pool):
+        # no-op if someone else already replaced it
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, use):
+        # use(pool), retried once on a fresh pool if a dead child broke the first
+        for retry in (True, False):
+            pool = self.get()
+            try:
+                return use(pool)
+            except BrokenProcessPool:
+                self.discard(pool)
+                if not retry:
+                    raise
+
+    def submit(self, fn, *args):
+        # also returns the pool, so a caller can later discard exactly the one that broke
+        return self.run(lambda pool: (pool.submit(fn, *args), pool))
+
+# === Monte Carlo Secret Santa sampler ===
+# Draws are simulated in NumPy batches (one row per draw) and batches are fanned
+# out over a process pool until every cell's standard error is under tolerance.
+MAX_GROUP_SIZE = 100
+MC_TOLERANCE = 1e-3
+MC_MAX_TRIALS = 200000
+MC_MAX_ATTEMPTS = 2000000  # includes dead-end draws, so tight exclusions can't spin forever
+MC_BATCH_SIZE = 10000
+MC_MAX_BATCH_CELLS = 2000000  # keeps a batch's (draws x n) arrays bounded for big groups
+MC_PROJECTION_TRIALS = 200  # finished draws before their variance is trusted over the prior
+
+sampler_pool = LazyPool(os.cpu_count() or 1)
+
+def sample_in_pool(n, batch_size, round_seeds, allowed):
+    workers = len(round_seeds)
+    return sampler_pool.run(lambda pool: list(pool.map(
+        sample_draws, [n] * workers, [batch_size] * workers, round_seeds, [allowed] * workers)))
+
+def sample_draws(n, trials, seed, allowed):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    rows = np.arange(trials)
+    remaining = np.ones((trials, n), dtype=bool)
+    picks = np.empty((trials, n), dtype=np.intp)
+    dead = np.zeros(trials, dtype=bool)
+    for i in range(n):
+        # uniform pick among the allowed names: largest random key wins
+        keys = rng.random((trials, n))
+        keys[~remaining] = -1.0
+        keys[:, ~allowed[i]] = -1.0
+        picks[:, i] = keys.argmax(1)
+        dead |= keys.max(1) < 0
+        remaining[rows, picks[:, i]] = False
+    # dead-end draws are thrown back in the hat, same as the exact engine
+    picks = picks[~dead]
+    cells = (np.arange(n) * n + picks).ravel()
+    counts = np.bincount(cells, minlength=n * n).reshape(n, n)
+    return counts, len(picks)
+
+def monte_carlo_probability_matrix(n, excluded=None, tolerance=MC_TOLERANCE, max_trials=MC_MAX_TRIALS,
+                                   batch_size=MC_BATCH_SIZE, workers=None, seed=None, check=None):
+    import numpy as np
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, min(batch_size, MC_MAX_BATCH_CELLS // (n * n)))
+    allowed = allowed_matrix(n, excluded)
+    # until enough draws finish, a cell's variance is taken as q(1 - q) with
+    # q = 1 / (names the giver may draw); it projects how many draws the tolerance needs
+    choices = allowed.sum(1)
+    shares = 1 / choices[choices > 1]
+    prior_spread = (shares * (1 - shares)).max() if len(shares) else 0.0
+    seeds = np.random.SeedSequence(seed)
+    counts = np.zeros((n, n))
+    trials = 0
+    attempts = 0
+    while trials < max_trials and attempts < MC_MAX_ATTEMPTS:
+        if check:
+            check()  # once per round, so a job can be cancelled between batches
+        round_seeds = seeds.spawn(workers)
+        if workers > 1:
+            results = sample_in_pool(n, batch_size, round_seeds, allowed)
+        else:
+            results = [sample_draws(n, batch_size, round_seeds[0], allowed)]
+        for batch_counts, batch_trials in results:
+            counts += batch_counts
+            trials += batch_trials
+        attempts += workers * batch_size
+        matrix = counts / max(trials, 1)
+        # smoothed, so a handful of lucky draws can't look converged
+        smoothed = (counts + 1) / (trials + 2)
+        stderr = np.sqrt(smoothed * (1 - smoothed) / max(trials, 1))
+        if trials and stderr.max() <= tolerance:
+            break
+        spread = prior_spread
+        if trials >= MC_PROJECTION_TRIALS:
+            spread = max(spread, (smoothed * (1 - smoothed)).max())
+        acceptance = (trials + 1) / attempts  # optimistic while few draws have finished
+        if min(max_trials, spread / tolerance ** 2) / acceptance > MC_MAX_ATTEMPTS:
+            # give up now rather than after burning the whole attempt budget
+            raise ValueError("Those exclusions leave almost no valid draws to sample.")
+    if not trials:
+        raise ValueError("Those exclusions leave almost no valid draws to sample.")
+    return matrix.tolist(), stderr.tolist()
+
+def group_label(i):
+    # A..Z, then AA, AB, ... like spreadsheet columns
+    label = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        label = chr(65 + r) + label
+    return label
+
+def parse_exclusions(text, n, mutual=False):
+    import numpy as np
+    # one "A-B" pair per line or comma: giver A can't draw B
+    labels = {group_label(i): i for i in range(n)}
+    excluded = np.zeros((n, n), dtype=bool)
+    for pair in re.split(r"[,\n]", text.upper()):
+        if not pair.strip():
+            continue
+        names = [name.strip() for name in pair.split("-")]
+        if len(names) != 2 or not all(name in labels for name in names):
+            raise ValueError(f"Couldn't read exclusion \"{pair.strip()}\" (use pairs like A-B).")
+        giver, receiver = labels[names[0]], labels[names[1]]
+        excluded[giver, receiver] = True
+        if mutual:
+            excluded[receiver, giver] = True
+    return excluded
+
+def probability_matrix(n, excluded=None, tolerance=MC_TOLERANCE, seed=None, check=None):
+    # returns (matrix, stderr); stderr is None when the answer is exact
+    if n >= 2 and not has_perfect_matching(allowed_matrix(n, excluded)):
+        raise ValueError("No valid draw exists with those exclusions.")
+    if n <= EXACT_MAX_N:
+        return exact_probability_matrix(n, excluded, check=check), None
+    return monte_carlo_probability_matrix(n, excluded, tolerance=tolerance, seed=seed, check=check)
+
+# === Secret Santa result cache ===
+# Matrices only depend on the group size and exclusions (sampled ones use a fixed seed), so they sit
+# in a size-bounded LRU in front of an NPZ table that `flask warm-secret-santa` fills.
+SECRET_SANTA_CACHE_PATH = os.path.join(BASE_DIR, "secret_santa_cache.npz")
+SECRET_SANTA_CACHE_BYTES = 32 * 1024 * 1024
+SECRET_SANTA_SEED = 0
+
+class MatrixCache:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.table = None
+        self.table_mtime = None
+
+    @staticmethod
+    def table_name(key):
+        n, mode, exclusions = key
+        return f"{mode}_{n}_{exclusions}" if exclusions else f"{mode}_{n}"
+
+    @staticmethod
+    def nbytes(value):
+        return sum(a.nbytes for a in value if a is not None)
+
+    def load(self, key):
+        import numpy as np
+        # on-disk table is reopened whenever the warm command rewrites it
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if mtime != self.table_mtime:
+            if self.table is not None:
+                self.table.close()
+            self.table = np.load(self.path)
+            self.table_mtime = mtime
+        name = self.table_name(key)
+        if name not in self.table.files:
+            return None
+        stderr = self.table[name + "_stderr"] if name + "_stderr" in self.table.files else None
+        return self.table[name], stderr
+
+    def put(self, key, value):
+        size = self.nbytes(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= self.nbytes(self.entries.pop(key))
+        self.entries[key] = value
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self.nbytes(evicted)
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            value = self.load(key)
+            if value is not None:
+                self.hits += 1
+                self.put(key, value)
+                return value
+            self.misses += 1
+        value = compute()
+        with self.lock:
+            self.put(key, value)
+        return value
+
+    def save(self, values):
+        import numpy as np
+        # merge into the existing table and swap the file in atomically
+        arrays = {}
+        if os.path.exists(self.path):
+            with np.load(self.path) as existing:
+                arrays.update({name: existing[name] for name in existing.files})
+        for key, (matrix, stderr) in values.items():
+            name = self.table_name(key)
+            arrays[name] = matrix
+            arrays.pop(name + "_stderr", None)
+            if stderr is not None:
+                arrays[name + "_stderr"] = stderr
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, self.path)
+
+secret_santa_cache = MatrixCache(SECRET_SANTA_CACHE_PATH, SECRET_SANTA_CACHE_BYTES)
+
+def secret_santa_key(n, excluded=None):
+    import numpy as np
+    exclusions = ""
+    if excluded is not None and excluded.any():
+        exclusions = hashlib.sha1(np.packbits(excluded).tobytes()).hexdigest()[:16]
+    return (n, "exact" if n <= EXACT_MAX_N else "sampled", exclusions)
+
+def compute_secret_santa(n, excluded=None, check=None):
+    import numpy as np
+    matrix, stderr = probability_matrix(n, excluded, seed=SECRET_SANTA_SEED, check=check)
+    return np.array(matrix), None if stderr is None else np.array(stderr)
+
+def cached_probability_matrix(n, excluded=None, offload=False, check=None):
+    key = secret_santa_key(n, excluded)
+
+    def compute():
+        # the exact DP is CPU-bound in this process; sampling already fans out to its own pool
+        if offload and key[1] == "exact":
+            return run_in_job_pool(compute_secret_santa, n, excluded, check)
+        return compute_secret_santa(n, excluded, check)
+
+    matrix, stderr = secret_santa_cache.get(key, compute)
+    return matrix.tolist(), None if stderr is None else stderr.tolist()
+
+@app.cli.command("warm-secret-santa")
+@click.option("--max-n", default=30, show_default=True, help="Largest group size to precompute.")
+def warm_secret_santa(max_n):
+    values = {}
+    for n in range(2, min(max_n, MAX_GROUP_SIZE) + 1):
+        values[secret_santa_key(n)] = compute_secret_santa(n)
+        click.echo(f"computed n={n} ({secret_santa_key(n)[1]})")
+    secret_santa_cache.save(values)
+    click.echo(f"wrote {len(values)} matrices to {secret_santa_cache.path}")
+
+# === Hapax analyzer ===
+# Uploads are tokenized chunk by chunk and the hapax count is kept up to date as
+# words go from 0 -> 1 -> 2 sightings, so each token costs O(1).
+WORD_RE = re.compile(r'\b\w+\b')
+TRAILING_WORD_RE = re.compile(r'\w+$')
+HAPAX_CHUNK_SIZE = 1 << 20  # characters per read
+
+def iter_words(stream, chunk_size=HAPAX_CHUNK_SIZE, check=None):
+    reader = io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+    carry = ""
+    try:
+        while True:
+            if check:
+                check()  # lets a job be cancelled between chunks
+            chunk = reader.read(chunk_size)
+            text = (carry + chunk).lower()
+            carry = ""
+            if chunk:
+                # a word touching the end of the chunk may continue in the next one
+                match = TRAILING_WORD_RE.search(text)
+                if match:
+                    carry = text[match.start():]
+                    text = text[:match.start()]
+            yield from WORD_RE.findall(text)
+            if not chunk:
+                break
+    finally:
+        reader.detach()  # leave the upload stream open for its owner
+
+# === Lexical statistics ===
+# The same pass keeps frequency-of-frequency counts (how many words were seen exactly
+# k times) and sum(count^2), which is all Yule's K, Herdan's C etc. need.
+MATTR_WINDOW = 500
+
+class LexicalStats:
+    def __init__(self, window=0):
+        self.counts = Counter()
+        self.freq_of_freq = Counter()
+        self.tokens = 0
+        self.sum_squares = 0
+        self.window = window
+        self.window_words = deque()
+        self.window_counts = Counter()
+        self.window_ttr_total = 0.0
+        self.full_windows = 0
+
+    def add(self, word):
+        count = self.counts[word]
+        self.counts[word] = count + 1
+        if count:
+            self.freq_of_freq[count] -= 1
+        self.freq_of_freq[count + 1] += 1
+        self.sum_squares += 2 * count + 1
+        self.tokens += 1
+        if self.window:
+            self.window_words.append(word)
+            self.window_counts[word] += 1
+            if len(self.window_words) > self.window:
+                old = self.window_words.popleft()
+                self.window_counts[old] -= 1
+                if not self.window_counts[old]:
+                    del self.window_counts[old]
+            if len(self.window_words) == self.window:
+                self.window_ttr_total += len(self.window_counts) / self.window
+                self.full_windows += 1
+
+    @classmethod
+    def from_counts(cls, counts):
+        stats = cls()
+        stats.counts = counts
+        stats.freq_of_freq = Counter(counts.values())
+        stats.tokens = sum(counts.values())
+        stats.sum_squares = sum(c * c for c in counts.values())
+        return stats
+
+    def final(self, metrics):
+        if not self.tokens:
+            return {name: 0.0 for name in metrics}
+        values = {name: LEXICAL_METRICS[name](self) for name in metrics}
+        if "window_ttr" in values and self.full_windows:
+            # moving-average TTR over every full window
+            values["window_ttr"] = self.window_ttr_total / self.full_windows
+        return values
+
+LEXICAL_METRICS = {
+    "hapax": lambda s: s.freq_of_freq[1] / s.tokens,
+    "dis": lambda s: s.freq_of_freq[2] / s.tokens,
+    "ttr": lambda s: len(s.counts) / s.tokens,
+    "yules_k": lambda s: 1e4 * (s.sum_squares - s.tokens) / s.tokens ** 2,
+    "herdans_c": lambda s: math.log(len(s.counts)) / math.log(s.tokens) if s.tokens > 1 else 1.0,
+    "window_ttr": lambda s: len(s.window_counts) / len(s.window_words),
+}
+
+def analyze_lexical(stream, metrics=("hapax",), window=MATTR_WINDOW, chunk_size=HAPAX_CHUNK_SIZE, keep_series=True,
+                    check=None):
+    unknown = [name for name in metrics if name not in LEXICAL_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metric(s): {', '.join(unknown)}")
+    if "window_ttr" in metrics and window < 1:
+        raise ValueError("window must be at least 1")
+    stats = LexicalStats(window if "window_ttr" in metrics else 0)
+    series = {name: array("d") for name in metrics} if keep_series else {}
+    running = [(LEXICAL_METRICS[name], series[name].append) for name in series]
+    for word in iter_words(stream, chunk_size, check):
+        stats.add(word)
+        for metric, append in running:
+            append(metric(stats))
+    return stats, series
+
+def analyze_hapax(stream, chunk_size=HAPAX_CHUNK_SIZE, check=None):
+    _, series = analyze_lexical(stream, ("hapax",), chunk_size=chunk_size, check=check)
+    return series["hapax"]
+
+# === Hapax chart ===
+# The page draws the curve client-side, so the series is cut down to a fixed point
+# budget with Largest-Triangle-Three-Buckets, which keeps the peaks and dips visible.
+HAPAX_PLOT_POINTS = 2000
+
+def downsample_lttb(y, threshold=HAPAX_PLOT_POINTS):
+    import numpy as np
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= threshold or threshold < 3:
+        return np.arange(n), y
+    # first and last points are kept; the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    idx = np.empty(threshold, dtype=np.intp)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for b in range(threshold - 2):
+        lo, hi = edges[b], edges[b + 1]
+        if b + 2 < len(edges):
+            cx = (edges[b + 1] + edges[b + 2] - 1) / 2
+            cy = y[edges[b + 1]:edges[b + 2]].mean()
+        else:
+            cx, cy = n - 1, y[-1]
+        xs = np.arange(lo, hi)
+        area = np.abs((a - cx) * (y[lo:hi] - y[a]) - (a - xs) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        idx[b + 1] = a
+    return idx, y[idx]
+
+def hapax_chart(hapax_rates, points=HAPAX_PLOT_POINTS):
+    import numpy as np
+    x, y = downsample_lttb(hapax_rates, points)
+    return {"x": x.tolist(), "y": np.round(y, 5).tolist(), "words": len(hapax_rates)}
+
+# === Corpus (batch) mode ===
+# Documents are streamed through the analyzer in a process pool without keeping
+# running series, so a worker only ever holds one document's word counts. Results
+# come back as they finish and are merged into corpus totals and vocabulary overlap.
+BATCH_TASKS_PER_CHILD = 50  # recycle workers so long corpora can't grow their memory
+BATCH_PAIRWISE_LIMIT = 50  # pairwise Jaccard table only for small corpora
+
+BATCH_RETRIES = 2  # a document in flight when a worker dies is retried on the fresh pool
+
+corpus_pool = LazyPool(os.cpu_count() or 1, max_tasks_per_child=BATCH_TASKS_PER_CHILD)
+
+def expand_sources(path, label):
+    # an archive becomes one source per .txt member; anything else is one document
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as z:
+            return [(f"{label}/{info.filename}", path, info.filename) for info in z.infolist()
+                    if not info.is_dir() and info.filename.lower().endswith(".txt")]
+    if tarfile.is_tarfile(path):
+        with tarfile.open(path) as t:
+            return [(f"{label}/{member.name}", path, member.name) for member in t.getmembers()
+                    if member.isfile() and member.name.lower().endswith(".txt")]
+    return [(label, path, None)]
+
+@contextmanager
+def open_document(path, member=None):
+    if member is None:
+        with open(path, "rb") as f:
+            yield f
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as z, z.open(member) as f:
+            yield f
+    else:
+        with tarfile.open(path) as t, t.extractfile(member) as f:
+            yield f
+
+def analyze_document(path, member, metrics, window):
+    with open_document(path, member) as stream:
+        stats, _ = analyze_lexical(stream, metrics, window, keep_series=False)
+    return stats.final(metrics), stats.counts
+
+def analyze_corpus(sources, metrics=("hapax",), window=MATTR_WINDOW, workers=None):
+    # yields one event per finished document, then the combined report
+    analyze_lexical(io.BytesIO(), metrics, window)  # validate arguments before fanning out
+    in_flight_limit = 2 * (workers or os.cpu_count() or 1)
+    pending = {}
+    queue = deque(enumerate(sources))
+    attempts = Counter()
+    corpus_counts = Counter()
+    document_frequency = Counter()
+    owner = {}
+    vocabularies = {} if len(sources) <= BATCH_PAIRWISE_LIMIT else None
+    documents = []
+    done = 0
+    while queue or pending:
+        while queue and len(pending) < in_flight_limit:
+            index, source = queue.popleft()
+            future, pool = corpus_pool.submit(analyze_document, source[1], source[2], list(metrics), window)
+            pending[future] = (index, source, pool)
+        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            index, source, used = pending.pop(future)
+            label = source[0]
+            try:
+                final, counts = future.result()
+            except BrokenProcessPool as e:
+                corpus_pool.discard(used)
+                attempts[index] += 1
+                if attempts[index] <= BATCH_RETRIES:
+                    queue.appendleft((index, source))
+                    continue
+                error = f"worker crashed: {e}"
+            except Exception as e:
+                error = str(e)
+            else:
+                error = None
+            done += 1
+            event = {"document": label, "index": index, "done": done, "total": len(sources)}
+            if error:
+                event["error"] = error
+                yield event
+                continue
+            corpus_counts.update(counts)
+            for word in counts:
+                document_frequency[word] += 1
+                owner[word] = index
+            if vocabularies is not None:
+                vocabularies[index] = set(counts)
+            event.update(words=sum(counts.values()), types=len(counts), final=final)
+            documents.append(event)
+            yield event
+
+    # words seen in exactly one document still point at that document in `owner`
+    exclusive = Counter(owner[word] for word, df in document_frequency.items() if df == 1)
+    for document in documents:
+        document["exclusive_types"] = exclusive[document["index"]]
+    corpus_metrics = [name for name in metrics if name != "window_ttr"]
+    overlap = {
+        "types": len(document_frequency),
+        "shared_by_all": sum(1 for df in document_frequency.values() if df == len(documents)) if documents else 0,
+        "in_one_document": sum(exclusive.values()),
+        "document_frequency": dict(sorted(Counter(document_frequency.values()).items())),
+    }
+    if vocabularies is not None:
+        ordered = sorted(vocabularies)
+        overlap["jaccard"] = [[len(vocabularies[a] & vocabularies[b]) / (len(vocabularies[a] | vocabularies[b]) or 1)
+                               for b in ordered] for a in ordered]
+    yield {
+        "corpus": True,
+        "documents": sorted(documents, key=lambda d: d["index"]),
+        "words": sum(corpus_counts.values()),
+        "final": LexicalStats.from_counts(corpus_counts).final(corpus_metrics),
+        "overlap": overlap,
+    }
+
+def requested_metrics():
+    return [name.strip() for name in request.args.get("metrics", "hapax").split(",") if name.strip()]
+
+@app.route('/api/hapax/batch', methods=["POST"])
+def api_hapax_batch():
+    # any number of "files" uploads (plain text, .zip or .tar archives), streamed back as NDJSON
+    metrics = requested_metrics()
+    window = request.args.get("window", MATTR_WINDOW, type=int)
+    uploads = request.files.getlist("files")
+    if not uploads:
+        return jsonify(error="Upload one or more files as \"files\"."), 400
+    workdir = tempfile.TemporaryDirectory()
+    sources = []
+    for i, upload in enumerate(uploads):
+        path = os.path.join(workdir.name, str(i))
+        upload.save(path)
+        sources.extend(expand_sources(path, upload.filename or f"file{i}"))
+    events = analyze_corpus(sources, metrics, window)
+    try:
+        first = next(events)
+    except ValueError as e:
+        workdir.cleanup()
+        return jsonify(error=str(e)), 400
+
+    def generate():
+        try:
+            yield json.dumps(first) + "\n"
+            for event in events:
+                yield json.dumps(event) + "\n"
+        finally:
+            workdir.cleanup()
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@app.cli.command("hapax-batch")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--metrics", default="hapax", show_default=True, help="Comma-separated metric names.")
+@click.option("--window", default=MATTR_WINDOW, show_default=True)
+@click.option("--output", type=click.File("w"), help="Write the combined report here as JSON.")
+def hapax_batch(paths, metrics, window, output):
+    sources = [source for path in paths for source in expand_sources(path, os.path.basename(path))]
+    metrics = [name.strip() for name in metrics.split(",") if name.strip()]
+    for event in analyze_corpus(sources, metrics, window):
+        if event.get("corpus"):
+            report = event
+        elif "error" in event:
+            click.echo(f"[{event['done']}/{event['total']}] {event['document']}: {event['error']}", err=True)
+        else:
+            click.echo(f"[{event['done']}/{event['total']}] {event['document']}: {event['words']} words")
+    click.echo(json.dumps(report, indent=2), file=output)
+
+@app.route('/api/hapax', methods=["POST"])
+def api_hapax():
+    # text comes from a "file" upload or the raw request body
+    metrics = requested_metrics()
+    window = request.args.get("window", MATTR_WINDOW, type=int)
+    points = request.args.get("points", HAPAX_PLOT_POINTS, type=int)
+    if points < 0:
+        return jsonify(error="points must be 0 (no series) or a positive number."), 400
+    if points:
+        points = min(max(points, 3), HAPAX_PLOT_POINTS)  # LTTB needs 3 points; below that it returns everything
+    if "file" in request.files:
+        stream = request.files["file"].stream
+    else:
+        stream = io.BufferedReader(request.stream)
+    try:
+        with stage("hapax-analyze"):
+            stats, series = analyze_lexical(stream, metrics, window, keep_series=bool(points))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    perf_metrics.observe("portfolio_hapax_tokens", stats.tokens)
+    result = {
+        "words": stats.tokens,
+        "types": len(stats.counts),
+        "final": stats.final(metrics),
+    }
+    if points:
+        with stage("hapax-chart"):
+            result["series"] = {name: hapax_chart(values, points) for name, values in series.items()}
+    return jsonify(result)
+
+# === Fact provider ===
+# A background thread keeps a small queue of facts that already fit on the slide,
+# so a FOD request never waits on the network. FOD_FACT_SOURCE can point at another
+# URL (e.g. a local stand-in server) or a text file with one fact per line.
+FACT_API_URL = "https://uselessfacts.jsph.pl/random.json?language=en"
+FACT_MAX_WORDS = 40
+FACT_QUEUE_SIZE = 20
+FACT_WAIT_SECONDS = 0.5  # how long a request waits for the very first facts
+FALLBACK_FACT = "Fun Fact: Whales are cool."
+
+class HttpFactSource:
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self.session = None
+
+    def fetch(self):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+            self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+            self.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        r = self.session.get(self.url, timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()["text"].replace("`", "'")
+
+class FileFactSource:
+    def __init__(self, path, max_words=FACT_MAX_WORDS):
+        # facts too long for the slide would only be fetched and thrown away
+        with open(path, encoding="utf-8") as f:
+            self.facts = [line.strip() for line in f if line.strip() and len(line.split()) <= max_words]
+
+    def fetch(self):
+        if not self.facts:
+            raise LookupError("fact file has no facts short enough for the slide")
+        return random.choice(self.facts)
+
+def make_fact_source(spec):
+    if spec.startswith(("http://", "https://")):
+        return HttpFactSource(spec)
+    return FileFactSource(spec)
+
+class CircuitBreaker:
+    # after `threshold` failures in a row, stop calling the source for `cooldown` seconds
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def wait_time(self):
+        if self.opened_at is None:
+            return 0
+        return max(0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+class FactProvider:
+    def __init__(self, source, size=FACT_QUEUE_SIZE, max_words=FACT_MAX_WORDS, breaker=None):
+        self.source = source
+        self.max_words = max_words
+        self.breaker = breaker or CircuitBreaker()
+        self.facts = queue.Queue(maxsize=size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        # the thread doesn't survive a fork, so each worker process starts its own
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive() or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.fill, name="fact-provider", daemon=True)
+                self.thread.start()
+
+    def fill(self):
+        while True:
+            if not self.breaker.allow():
+                time.sleep(self.breaker.wait_time())
+                continue
+            try:
+                with stage("fact-fetch"):
+                    fact = self.source.fetch()
+                if len(fact.split()) > self.max_words:
+                    raise ValueError("fact too long for the slide")
+            except Exception:
+                # an oversized fact backs off too, so a source of only long facts can't spin
+                self.breaker.failure()
+                time.sleep(min(2 ** self.breaker.failures, 30) / 10)
+                continue
+            self.breaker.success()
+            self.facts.put(fact)  # blocks while the queue is full
+
+    def get(self, timeout=FACT_WAIT_SECONDS):
+        self.start()
+        try:
+            return self.facts.get(timeout=timeout)
+        except queue.Empty:
+            return FALLBACK_FACT
+
+fact_provider = FactProvider(make_fact_source(os.environ.get("FOD_FACT_SOURCE", FACT_API_URL)))
+
+# === FOD rendering ===
+# Fonts for every size the layout can use and the thumbnailed foreground images are
+# loaded once (on first render or in warm_up()); word widths are memoized so
+# wrapping is just additions.
+FOD_WIDTH, FOD_HEIGHT = 960, 540
+FOD_IMAGE_FOLDER = os.path.join(BASE_DIR, "static", "fod_images")
+FOD_FONT_PATH = os.path.join(BASE_DIR, "static", "fonts", "Anton-Regular.ttf")
+FOD_TITLE_SIZE = 52
+FOD_FACT_SIZES = list(range(22, 47, 2))  # auto-scale candidates for the fact text
+FOD_FALLBACK_SIZE = 24
+FOD_TEXT_WIDTH = 400
+
+class FodAssets:
+    def __init__(self, image_folder, font_path):
+        self.image_folder = image_folder
+        self.font_path = font_path
+        self.fonts = {}
+        self.line_heights = {}
+        self.space_widths = {}
+        self.foregrounds = {}
+        self.image_names = []
+        self.word_width = lru_cache(maxsize=8192)(self.measure_word)
+        self.lock = threading.Lock()
+        self.ready = False
+
+    def loaded(self):
+        if not self.ready:
+            with self.lock:
+                if not self.ready:
+                    self.load()
+                    self.ready = True
+        return self
+
+    def load(self):
+        from PIL import Image, ImageFont
+        for size in {FOD_TITLE_SIZE, FOD_FALLBACK_SIZE, *FOD_FACT_SIZES}:
+            font = ImageFont.truetype(self.font_path, size)
+            top, bottom = font.getbbox("A")[1], font.getbbox("A")[3]
+            self.fonts[size] = font
+            self.line_heights[size] = bottom - top + 8
+            self.space_widths[size] = font.getlength(" ")
+        for name in sorted(os.listdir(self.image_folder)):
+            if name.lower().endswith((".png", ".jpg", ".jpeg")):
+                with Image.open(os.path.join(self.image_folder, name)) as source:
+                    fg_img = source.convert("RGBA")
+                fg_img.thumbnail((400, 400))
+                self.foregrounds[name] = fg_img
+        self.image_names = sorted(self.foregrounds)
+        return self
+
+    def measure_word(self, size, word):
+        return self.fonts[size].getlength(word)
+
+    def wrap_text(self, text, size, max_width):
+        lines, line, width = [], [], 0.0
+        space = self.space_widths[size]
+        for word in text.split():
+            word_width = self.word_width(size, word) + space
+            if line and width + word_width > max_width:
+                lines.append(" ".join(line))
+                line, width = [], 0.0
+            line.append(word)
+            width += word_width
+        lines.append(" ".join(line))
+        return lines
+
+    def fit_text(self, text, max_width, max_height):
+        # binary search for the largest size whose wrapped text fits vertically
+        lo, hi = 0, len(FOD_FACT_SIZES) - 1
+        best = None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            size = FOD_FACT_SIZES[mid]
+            lines = self.wrap_text(text, size, max_width)
+            if len(lines) * self.line_heights[size] <= max_height:
+                best = (size, lines)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        if best is None:
+            return FOD_FALLBACK_SIZE, self.wrap_text(text, FOD_FALLBACK_SIZE, max_width)
+        return best
+
+fod_assets = FodAssets(FOD_IMAGE_FOLDER, FOD_FONT_PATH)
+
+def render_fod(fact, date, image_name, color):
+    from PIL import Image, ImageDraw
+
+    # === Canvas ===
+    W, H = FOD_WIDTH, FOD_HEIGHT
+    img = Image.new("RGB", (W, H), color)
+    draw = ImageDraw.Draw(img)
+    assets = fod_assets.loaded()
+    fg_img = assets.foregrounds.get(image_name)
+
+    # === Layout side alternates by day ===
+    image_on_left = date.day % 2 == 1
+
+    # === Title ===
+    title_font = assets.fonts[FOD_TITLE_SIZE]
+    title_text = f"FOD {date.strftime('%m/%d/%y')}:"
+    title_width = title_font.getlength(title_text)
+    title_height = title_font.getbbox(title_text)[3] - title_font.getbbox(title_text)[1]
+
+    # === Auto-scale fact font ===
+    with stage("font-fit"):
+        font_size, lines = assets.fit_text(fact, FOD_TEXT_WIDTH, int(H * 0.6))
+    fact_font = assets.fonts[font_size]
+
+    # === Place image ===
+    if fg_img:
+        img_x = 50 if image_on_left else W - fg_img.width - 50
+        img_y = (H - fg_img.height) // 2
+        img.paste(fg_img, (img_x, img_y), fg_img)
+    text_x = W - 450 if image_on_left else 50  # opposite side of image
+
+    # === Draw title ===
+    draw.text((text_x, 50), title_text, font=title_font, fill="white")
+    draw.line((text_x, 50 + title_height + 15, text_x + title_width, 50 + title_height + 15),
+            fill="white", width=4)
+
+    # === Draw fact ===
+    line_height = assets.line_heights[font_size]
+    total_height = len(lines) * line_height
+    start_y = (H - total_height) // 2 + 20
+    for i, line in enumerate(lines):
+        draw.text((text_x, start_y + i * line_height), line, font=fact_font, fill="white")
+    return img
+
+# === FOD image endpoint ===
+# A slide's URL carries its whole spec (fact, image, color; the date is in the path),
+# signed with an HMAC, so any worker can render it at any time and the URL never
+# changes meaning. Encoded bytes are cached, so repeat views are 304s or cache hits.
+FOD_SECRET_PATH = os.path.join(BASE_DIR, ".fod_secret")
+FOD_CACHE_BYTES = 64 * 1024 * 1024
+FOD_MAX_AGE = 365 * 24 * 3600  # a signed URL never changes meaning, so browsers can keep it
+FOD_WEBP_QUALITY = 85
+FOD_FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+class ByteLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, size):
+        with self.lock:
+            if size > self.max_bytes:
+                return
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+fod_render_cache = ByteLRU(FOD_CACHE_BYTES)
+
+@lru_cache(maxsize=1)
+def fod_secret():
+    # FOD_SECRET if set; otherwise a key generated once and shared through a file, so
+    # every worker (and every restart) signs the same way
+    secret = os.environ.get("FOD_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    try:
+        fd = os.open(FOD_SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(32).hex().encode("ascii"))
+    for _ in range(50):
+        with open(FOD_SECRET_PATH, "rb") as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+        time.sleep(0.01)  # another worker is still writing it
+    raise RuntimeError(f"{FOD_SECRET_PATH} is empty")
+
+def fod_signature(date_text, payload):
+    message = f"{date_text}/{payload}".encode("ascii")
+    return hmac.new(fod_secret(), message, hashlib.sha256).hexdigest()[:20]
+
+def fod_urls(fact, date, image_name, color):
+    spec = json.dumps([fact, image_name, list(color)], separators=(",", ":")).encode("utf-8")
+    payload = base64.urlsafe_b64encode(zlib.compress(spec, 9)).decode("ascii").rstrip("=")
+    signature = fod_signature(date.isoformat(), payload)
+    return {ext: f"/fod/{date.isoformat()}/{signature}/{payload}.{ext}" for ext in FOD_FORMATS}
+
+FOD_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+FOD_SIGNATURE_RE = re.compile(r"[0-9a-f]{20}")
+FOD_PAYLOAD_RE = re.compile(r"[A-Za-z0-9_-]+")
+
+def decode_fod_spec(date_text, signature, payload):
+    # None for anything we didn't sign ourselves; shape is checked first so junk never reaches the HMAC
+    if not (FOD_DATE_RE.fullmatch(date_text) and FOD_SIGNATURE_RE.fullmatch(signature)
+            and FOD_PAYLOAD_RE.fullmatch(payload)):
+        return None
+    if not hmac.compare_digest(signature, fod_signature(date_text, payload)):
+        return None
+    try:
+        date = datetime.date.fromisoformat(date_text)
+        spec = zlib.decompress(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        fact, image_name, color = json.loads(spec)
+    except (ValueError, TypeError, zlib.error):
+        return None
+    return {"fact": fact, "date": date, "image": image_name, "color": tuple(color),
+            "created": datetime.datetime.combine(date, datetime.time(), datetime.timezone.utc)}
+
+def encode_fod(img, ext):
+    buf = io.BytesIO()
+    if ext == "webp":
+        img.save(buf, format="WEBP", quality=FOD_WEBP_QUALITY, method=6)
     else:
-        counts = [[0]*n for _ in range(n)]
-        for _ in range(monte_carlo_trials):
-            remaining = list(range(n))
-            assigned = [-1]*n
-            for i in range(n):
-                options = [x for x in remaining if x != i]
-                if not options:
-                    swap_with = random.choice(range(i))
-                    assigned[i] = assigned[swap_with]
-                    assigned[swap_with] = i
-                    break
-                pick = random.choice(options)
-                assigned[i] = pick
-                remaining.remove(pick)
-            for i, p in enumerate(assigned):
-                counts[i][p] += 1
-        return [[c/monte_carlo_trials for c in row] for row in counts]
+        img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+@app.route('/fod/<date>/<signature>/<payload>.<ext>')
+def fod_image(date, signature, payload, ext):
+    if ext not in FOD_FORMATS:
+        abort(404)
+    spec = decode_fod_spec(date, signature, payload)
+    if spec is None:
+        abort(404)
+    cached = fod_render_cache.get((signature, ext))
+    if cached is None:
+        with stage("fod-render"):
+            img = render_fod(spec["fact"], spec["date"], spec["image"], spec["color"])
+        with stage("fod-encode", ext):
+            data = encode_fod(img, ext)
+        fod_render_cache.put((signature, ext), data, len(data))
+    else:
+        data = cached[0]
+    response = send_file(io.BytesIO(data), mimetype=FOD_FORMATS[ext], etag=f"{signature}-{ext}",
+                         last_modified=spec["created"], max_age=FOD_MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# === Demo jobs ===
+# The heavy demos run on a small worker pool instead of the request thread. A POST
+# gets a job id right away and the page polls /jobs/<id> until the result is ready.
+# Job records live on disk, one JSON file per id, so any worker of a pre-fork server
+# can answer the poll; only the worker that owns a job writes its record, and
+# cancelling from elsewhere drops a <id>.cancel marker the owner checks.
+JOB_FOLDER = os.path.join(BASE_DIR, "jobs")
+JOB_WORKERS = 2
+JOB_PROCESSES = JOB_WORKERS  # each job thread waits on at most one CPU-bound call
+JOB_MAX_PENDING = 8  # queued + running in this process; anything past this gets a 429
+JOB_TIMEOUT = 60
+JOB_QUEUE_TIMEOUT = 300  # longer than a full queue takes to drain, so only orphaned jobs hit it
+JOB_RESULT_TTL = 600
+JOB_RETRY_AFTER = 5
+JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+class JobRejected(Exception):
+    pass
+
+class JobCancelled(Exception):
+    pass
+
+class JobCheck:
+    # picklable, so jobs running in the job process pool can be stopped too
+    def __init__(self, cancel_path, deadline):
+        self.cancel_path = cancel_path
+        self.deadline = deadline
+
+    def __call__(self):
+        if time.time() > self.deadline or os.path.exists(self.cancel_path):
+            raise JobCancelled()
+
+class Job:
+    def __init__(self, kind, form, timeout):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.form = form
+        self.timeout = timeout
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted = time.time()  # wall clock, since other processes read these
+        self.started = None
+        self.finished = None
+        self.stages = []  # (name, detail, seconds) from stage() calls made while running
+        # only set on the owning worker's copy
+        self.future = None
+        self.cleanup = None
+        self.cleanup_lock = threading.Lock()
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record["kind"], record["form"], record["timeout"])
+        for name in ("id", "status", "result", "error", "submitted", "started", "finished"):
+            setattr(job, name, record[name])
+        job.stages = [tuple(entry) for entry in record["stages"]]
+        return job
+
+    def to_record(self):
+        return {name: getattr(self, name) for name in (
+            "id", "kind", "form", "timeout", "status", "result", "error",
+            "submitted", "started", "finished", "stages")}
+
+    def deadline(self):
+        if self.started is None:
+            return self.submitted + JOB_QUEUE_TIMEOUT
+        return self.started + self.timeout
+
+    def release(self):
+        with self.cleanup_lock:
+            cleanup, self.cleanup = self.cleanup, None
+        if cleanup:
+            cleanup()
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = time.time()
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "queued_for": round((self.started or now) - self.submitted, 3),
+            "ran_for": round((self.finished or now) - self.started, 3) if self.started else None,
+            "result": self.result if self.status == "done" else None,
+        }
+
+class JobManager:
+    def __init__(self, folder=JOB_FOLDER, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl=JOB_RESULT_TTL):
+        self.folder = folder
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="demo-job")
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.local = {}  # jobs this process has queued or is running
+        self.lock = threading.Lock()
+
+    def path(self, job_id, suffix=".json"):
+        return os.path.join(self.folder, job_id + suffix)
+
+    def save(self, job):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(job.id)
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_record(), f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id):
+        if not JOB_ID_RE.fullmatch(job_id):
+            return None
+        try:
+            with open(self.path(job_id), encoding="utf-8") as f:
+                job = Job.from_record(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        if job.status in ("queued", "running"):
+            # the owner may not have noticed yet (or may be gone), so readers work it out too
+            if os.path.exists(self.path(job_id, ".cancel")):
+                job.finish("cancelled")
+            elif time.time() > job.deadline():
+                job.finish("timeout", error=f"Took longer than {job.timeout} seconds.")
+        return job
+
+    def sweep(self):
+        # any worker may drop expired records; the ttl counts from a record's last write
+        cutoff = time.time() - self.ttl
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def admit(self):
+        # cheap pre-check so a request doesn't stage an upload only to get a 429;
+        # capacity is per process, like the threads and job processes behind it
+        with self.lock:
+            if len(self.local) >= self.max_pending:
+                raise JobRejected()
+
+    def submit(self, kind, fn, *args, form=None, timeout=JOB_TIMEOUT, cleanup=None):
+        # cleanup (e.g. deleting a staged upload) runs exactly once, however the job ends
+        with self.lock:
+            if len(self.local) >= self.max_pending:
+                if cleanup:
+                    cleanup()
+                raise JobRejected()
+            job = Job(kind, dict(form or {}), timeout)
+            job.cleanup = cleanup
+            try:
+                self.sweep()
+                self.save(job)
+            except BaseException:
+                job.release()
+                raise
+            self.local[job.id] = job
+            job.future = self.executor.submit(self.run, job, fn, args)
+        return job
+
+    def run(self, job, fn, args):
+        try:
+            self.execute(job, fn, args)
+        finally:
+            with self.lock:
+                self.local.pop(job.id, None)
+            job.release()
+
+    def execute(self, job, fn, args):
+        current = self.load(job.id)
+        if current is None or current.status != "queued":
+            if current is not None:
+                self.save(current)  # cancelled while waiting: make it final
+            return
+        job.status = "running"
+        job.started = time.time()
+        self.save(job)
+        perf_metrics.observe("portfolio_job_queue_seconds", job.started - job.submitted, kind=job.kind)
+        check = JobCheck(self.path(job.id, ".cancel"), job.deadline())
+        request_timing.stages = job.stages
+        if profiler:
+            profiler.start()
+        try:
+            result = fn(check, *args)
+        except JobCancelled:
+            status, result, error = "cancelled", None, None  # load() below tells cancel from timeout
+        except Exception as e:
+            status, result, error = "failed", None, str(e)
+        else:
+            status, error = "done", None
+        finally:
+            request_timing.stages = None
+            ran_for = time.time() - job.started
+            perf_metrics.observe("portfolio_job_seconds", ran_for, kind=job.kind)
+            if profiler:
+                profiler.stop(ran_for, f"job {job.kind}")
+        current = self.load(job.id)
+        if current is not None and current.status != "running":
+            status, result, error = current.status, None, current.error
+        job.finish(status, result, error)
+        self.save(job)
+
+    def get(self, job_id):
+        return self.load(job_id)
+
+    def cancel(self, job_id):
+        job = self.load(job_id)
+        if job is None or job.status not in ("queued", "running"):
+            return job
+        open(self.path(job_id, ".cancel"), "w").close()
+        with self.lock:
+            local = self.local.get(job_id)
+            if local is not None and local.future.cancel():
+                del self.local[job_id]
+            else:
+                local = None
+        if local is not None:
+            # never started here, so run() won't record or clean up after it
+            local.finish("cancelled")
+            self.save(local)
+            local.release()
+        return self.load(job_id)
+
+    def counts(self):
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return Counter()
+        return Counter(job.status for job in (self.load(name[:-5]) for name in names if name.endswith(".json"))
+                       if job is not None)
+
+jobs = JobManager()
+
+# pure-Python work like the hapax scan would hold the GIL the request threads need
+job_pool = LazyPool(JOB_PROCESSES)
+
+def call_with_stages(fn, args):
+    # runs in a job process; the stage() timings travel back with the result
+    request_timing.stages = []
+    try:
+        return fn(*args), request_timing.stages
+    finally:
+        request_timing.stages = None
+
+def run_in_job_pool(fn, *args):
+    result, stages = job_pool.run(lambda pool: pool.submit(call_with_stages, fn, args).result())
+    for name, detail, seconds in stages:
+        record_stage(name, seconds, detail)
+    return result
+
+def secret_santa_job(check, n, excluded):
+    perf_metrics.observe("portfolio_secret_santa_group_size", n)
+    with stage("secret-santa"):
+        matrix, stderr = cached_probability_matrix(n, excluded, offload=True, check=check)
+    return {
+        "secret_santa_matrix": matrix,
+        "secret_santa_labels": [group_label(i) for i in range(n)],  # precompute labels
+        "secret_santa_error": max(max(row) for row in stderr) if stderr else None,
+    }
+
+def fod_job(check):
+    with stage("fact-wait"):
+        fact = fact_provider.get()
+    image_names = fod_assets.loaded().image_names
+    return {"fact_img": fod_urls(
+        fact,
+        datetime.date.today(),
+        random.choice(image_names) if image_names else None,
+        (random.randint(0, 150), random.randint(0, 150), random.randint(0, 150))
+    )}
+
+def hapax_file_chart(path, check):
+    with open(path, "rb") as f, stage("hapax-analyze"):
+        hapax_rates = analyze_hapax(f, check=check)
+    with stage("hapax-chart"):
+        return hapax_chart(hapax_rates)
+
+def hapax_job(check, path):
+    chart = run_in_job_pool(hapax_file_chart, path, check)
+    perf_metrics.observe("portfolio_hapax_tokens", chart["words"])
+    return {"hapax_series": chart}
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def save_upload(upload):
+    # the request's upload is gone once we respond, so the job reads its own copy
+    fd, path = tempfile.mkstemp(prefix="hapax-", suffix=".txt")
+    try:
+        with os.fdopen(fd, "wb") as f, stage("upload-save"):
+            shutil.copyfileobj(upload.stream, f)
+            perf_metrics.observe("portfolio_upload_bytes", f.tell())
+    except BaseException:
+        remove_file(path)
+        raise
+    return path
+
+@app.route('/jobs/<job_id>', methods=["GET", "DELETE"])
+def job_status(job_id):
+    job = jobs.cancel(job_id) if request.method == "DELETE" else jobs.get(job_id)
+    if job is None:
+        return jsonify(error="No such job (results expire after a while)."), 404
+    response = jsonify(job.to_dict())
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 @app.route('/project/<key>', methods=["GET", "POST"])
 def project(key):
@@ -297,216 +2131,684 @@ def project(key):
     if not project:
         abort(404)
 
-    hapax_img = None
-    fact_img = None
-    secret_santa_matrix = None
-    secret_santa_labels = []
+    context = {
+        "hapax_series": None,
+        "fact_img": None,
+        "secret_santa_matrix": None,
+        "secret_santa_labels": [],
+        "secret_santa_error": None,
+        "secret_santa_problem": None,
+        "job": None,
+        "job_problem": None,
+        "form": request.form,
+    }
+    status = 200
 
-    # === Secret Santa Demo ===
-    if key == "secret-santa" and request.method == "POST":
-        n = int(request.form.get("group_size", 4))
-        secret_santa_matrix = probability_matrix(n)
-        secret_santa_labels = [chr(65+i) for i in range(n)]  # precompute labels
+    if request.method == "POST":
+        try:
+            # === Secret Santa Demo ===
+            if key == "secret-santa":
+                n = min(max(request.form.get("group_size", 4, type=int), 2), MAX_GROUP_SIZE)
+                try:
+                    excluded = parse_exclusions(request.form.get("exclusions", ""), n,
+                                                mutual=bool(request.form.get("mutual")))
+                except ValueError as e:
+                    context["secret_santa_problem"] = str(e)
+                else:
+                    job = jobs.submit(key, secret_santa_job, n, excluded, form=request.form)
+                    return redirect(url_for("project", key=key, job=job.id), code=303)
 
-    # === Handle FOD Generator ===
-    if key == "fact-of-the-day" and request.method == "POST":
-        import requests, io, base64, random, datetime, os
-        from PIL import Image, ImageDraw, ImageFont
+            # === Handle FOD Generator ===
+            if key == "fact-of-the-day":
+                job = jobs.submit(key, fod_job)
+                return redirect(url_for("project", key=key, job=job.id), code=303)
 
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        IMAGE_FOLDER = os.path.join(BASE_DIR, 'static', 'fod_images')
-        FONT_PATH = os.path.join(BASE_DIR, "static", "fonts", "Anton-Regular.ttf")
+            # === Handle Hapax Analyzer ===
+            if key == "hapax-analyzer":
+                jobs.admit()
+                path = save_upload(request.files["file"])
+                job = jobs.submit(key, hapax_job, path, cleanup=lambda: remove_file(path))
+                return redirect(url_for("project", key=key, job=job.id), code=303)
+        except JobRejected:
+            context["job_problem"] = "The demos are busy right now. Please try again in a few seconds."
+            status = 429
 
-        def get_random_fact():
-            url = "https://uselessfacts.jsph.pl/random.json?language=en"
-            try:
-                r = requests.get(url, timeout=5)
-                r.raise_for_status()
-                return r.json()["text"].replace("`", "'")
-            except:
-                return "Fun Fact: Whales are cool."
-
-        def wrap_text(text, font, max_width):
-            lines, line = [], ""
-            for word in text.split():
-                test = line + word + " "
-                if font.getlength(test) <= max_width:
-                    line = test
-                else:
-                    lines.append(line.strip())
-                    line = word + " "
-            lines.append(line.strip())
-            return lines
-
-        # === Get valid fact with rerolls ===
-        max_words = 40
-        reroll_limit = 10
-        rerolls = 0
-        fact = get_random_fact()
-
-        while rerolls < reroll_limit:
-            word_count = len(fact.split())
-            if word_count > max_words:
-                fact = get_random_fact()
-                rerolls += 1
-                continue
-            break
+    # === Show a submitted job's progress or result ===
+    job_id = request.args.get("job")
+    if job_id:
+        job = jobs.get(job_id)
+        if job is None or job.kind != key:
+            context["job_problem"] = "That result has expired. Please run the demo again."
         else:
-            fact = "Fun Fact: Whales are cool."
-
-        # === Canvas ===
-        W, H = 960, 540
-        img = Image.new(
-            "RGB",
-            (W, H),
-            (random.randint(0, 150), random.randint(0, 150), random.randint(0, 150))
-        )
-        draw = ImageDraw.Draw(img)
-
-        # === Random image ===
-        images = [f for f in os.listdir(IMAGE_FOLDER) if f.lower().endswith((".png", ".jpg", ".jpeg"))]
-        if images:
-            img_path = os.path.join(IMAGE_FOLDER, random.choice(images))
-            fg_img = Image.open(img_path).convert("RGBA")
-            fg_img.thumbnail((400, 400))
-        else:
-            fg_img = None
-
-        # === Randomly choose layout side ===
-        image_on_left = datetime.date.today().day % 2 == 1
-
-        # === Title ===
-        title_font = ImageFont.truetype(FONT_PATH, 52)
-        date_str = datetime.date.today().strftime("%m/%d/%y")
-        title_text = f"FOD {date_str}:"
-        title_width = title_font.getlength(title_text)
-        title_height = title_font.getbbox(title_text)[3] - title_font.getbbox(title_text)[1]
-
-        # === Auto-scale fact font ===
-        max_fact_height = int(H * 0.6)
-        font_size = 46
-        while font_size > 20:
-            test_font = ImageFont.truetype(FONT_PATH, font_size)
-            lines = wrap_text(fact, test_font, 400)
-            total_height = len(lines) * (test_font.getbbox("A")[3] - test_font.getbbox("A")[1] + 8)
-            if total_height <= max_fact_height:
-                fact_font = test_font
-                break
-            font_size -= 2
-        else:
-            fact_font = ImageFont.truetype(FONT_PATH, 24)
-
-        # === Place image ===
-        if fg_img:
-            img_x = 50 if image_on_left else W - fg_img.width - 50
-            img_y = (H - fg_img.height) // 2
-            img.paste(fg_img, (img_x, img_y), fg_img)
-        text_x = W - 450 if image_on_left else 50  # opposite side of image
-
-        # === Draw title ===
-        draw.text((text_x, 50), title_text, font=title_font, fill="white")
-        draw.line((text_x, 50 + title_height + 15, text_x + title_width, 50 + title_height + 15),
-                fill="white", width=4)
-
-        # === Draw fact ===
-        lines = wrap_text(fact, fact_font, 400)
-        line_height = fact_font.getbbox("A")[3] - fact_font.getbbox("A")[1] + 8
-        total_height = len(lines) * line_height
-        start_y = (H - total_height) // 2 + 20
-        for i, line in enumerate(lines):
-            draw.text((text_x, start_y + i * line_height), line, font=fact_font, fill="white")
-
-        # === Convert to base64 ===
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        buf.seek(0)
-        fact_img = base64.b64encode(buf.read()).decode("utf-8")
-
-    # === Handle Hapax Analyzer ===
-    if key == "hapax-analyzer" and request.method == "POST":
-        import re, io, base64
-        from collections import Counter
-        import matplotlib.pyplot as plt
-
-        file = request.files["file"]
-        text = file.read().decode("utf-8").lower()
-        words = re.findall(r'\b\w+\b', text)
-        seen_counts = Counter()
-        hapax_rates = []
-
-        for i, word in enumerate(words):
-            seen_counts[word] += 1
-            hapaxes = sum(1 for c in seen_counts.values() if c == 1)
-            hapax_rates.append(hapaxes / (i + 1))
-
-        plt.figure(figsize=(14, 6))
-        plt.plot(hapax_rates, color='blue', linewidth=1)
-        plt.title("Hapax Legomena Rate Over Text Progression")
-        plt.xlabel("Word Index")
-        plt.ylabel("Hapax Rate")
-        plt.grid(True)
-        plt.tight_layout()
-
-        img = io.BytesIO()
-        plt.savefig(img, format="png")
-        img.seek(0)
-        plt.close()
-
-        hapax_img = base64.b64encode(img.read()).decode('utf-8')
+            context["job"] = job
+            context["form"] = job.form
+            if job.status == "done":
+                context.update(job.result)
+                # the work happened in the job, so show its stages alongside this render
+                request_timing.stages.extend((f"job-{name}", detail, seconds)
+                                             for name, detail, seconds in job.stages)
+            elif job.status == "failed" and key == "secret-santa":
+                context["secret_santa_problem"] = job.error
+            elif job.status != "running" and job.status != "queued":
+                context["job_problem"] = job.error or f"The job was {job.status}."
 
     # ✅ Unified return
-    return render_template(
+    response = app.make_response((render_template(
         "project.html",
         project=project,
         title=project["title"],
-        fact_img=fact_img,
-        hapax_img=hapax_img,
-        secret_santa_matrix=secret_santa_matrix,
-        secret_santa_labels=secret_santa_labels,
-        key=key
-    )
+        key=key,
+        **context
+    ), status))
+    if status == 429:
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+    if job_id:
+        response.headers["Cache-Control"] = "no-store"
+    return response
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEVLOGS_FOLDER = os.path.join(BASE_DIR, 'devlogs_md')
 
+DEVLOG_SCAN_INTERVAL = 2.0  # seconds between directory scans for new/removed files
+
+def parse_devlog(content):
+    # Extract header metadata
+    header_match = re.match(r"---\n(.*?)\n---\n(.*)", content, re.DOTALL)
+    if not header_match:
+        return None
+    header_text, body_md = header_match.groups()
+    metadata = {}
+    for line in header_text.split("\n"):
+        if ":" in line:
+            key, value = line.split(":", 1)
+            metadata[key.strip()] = value.strip()
+    return metadata, body_md
+
+# === Devlog store ===
+# Entries are parsed once and kept by id. The list page only needs the header
+# metadata; markdown is rendered the first time an entry is opened. Each entry
+# remembers its file's mtime and is re-read on its own when that changes.
+class DevlogStore:
+    def __init__(self, folder, scan_interval=DEVLOG_SCAN_INTERVAL):
+        self.folder = folder
+        self.scan_interval = scan_interval
+        self.entries = {}
+        self.listing = []
+        self.lock = threading.RLock()
+        self.scanned_at = None
+        self.generation = 0  # bumped whenever any entry changes
+
+    def path(self, devlog_id):
+        return os.path.join(self.folder, f"{devlog_id}.md")
+
+    def load(self, devlog_id, mtime):
+        with open(self.path(devlog_id), "r", encoding="utf-8") as f:
+            parsed = parse_devlog(f.read())
+        if parsed is None:
+            self.entries.pop(devlog_id, None)
+            return
+        metadata, body_md = parsed
+        self.entries[devlog_id] = {
+            "meta": {
+                "id": devlog_id,
+                "title": metadata.get("title", "Untitled"),
+                "date": metadata.get("date", ""),
+                "summary": metadata.get("summary", ""),
+            },
+            "body": body_md,
+            "html": None,
+            "mtime": mtime,
+        }
+
+    def rebuild_listing(self):
+        self.listing = [self.entries[i]["meta"] for i in sorted(self.entries)]  # sort by ID
+
+    def scan(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.scanned_at is not None and now - self.scanned_at < self.scan_interval:
+                return
+            self.scanned_at = now
+            with stage("devlog-scan"):
+                self.rescan()
+
+    def rescan(self):
+        # called with the lock held
+        seen = set()
+        changed = False
+        for item in os.scandir(self.folder):
+            stem = item.name[:-3]
+            if not item.name.endswith(".md") or not stem.isdigit():
+                continue
+            devlog_id = int(stem)
+            seen.add(devlog_id)
+            mtime = item.stat().st_mtime_ns
+            entry = self.entries.get(devlog_id)
+            if entry is None or entry["mtime"] != mtime:
+                self.load(devlog_id, mtime)
+                changed = True
+        for devlog_id in set(self.entries) - seen:
+            del self.entries[devlog_id]
+            changed = True
+        if changed:
+            self.rebuild_listing()
+            self.generation += 1
+
+    def list(self):
+        self.scan()
+        return self.listing
+
+    def get(self, devlog_id):
+        self.scan()
+        with self.lock:
+            entry = self.entries.get(devlog_id)
+            if entry is None:
+                return None
+            # one stat keeps a single entry fresh between directory scans
+            try:
+                mtime = os.stat(self.path(devlog_id)).st_mtime_ns
+            except FileNotFoundError:
+                del self.entries[devlog_id]
+                self.rebuild_listing()
+                self.generation += 1
+                return None
+            if mtime != entry["mtime"]:
+                self.load(devlog_id, mtime)
+                self.rebuild_listing()
+                self.generation += 1
+                entry = self.entries.get(devlog_id)
+                if entry is None:
+                    return None
+            if entry["html"] is None:
+                import markdown
+                with stage("markdown"):
+                    entry["html"] = markdown.markdown(entry["body"])
+            return dict(entry["meta"], content=entry["html"])
+
+devlog_store = DevlogStore(DEVLOGS_FOLDER)
+
+# === Devlog search ===
+# Inverted index (token -> {devlog id: term frequency}) ranked with BM25. It's kept
+# in step with the store by mtime, so only changed entries are re-tokenized, and
+# it's saved to disk so a restart doesn't have to rebuild it.
+DEVLOG_INDEX_PATH = os.path.join(BASE_DIR, "devlog_index.json")
+DEVLOG_INDEX_VERSION = 1
+SEARCH_TOKEN_RE = re.compile(r"[^\W_]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.7  # prefix expansions count a bit less than exact matches
+PREFIX_EXPANSIONS = 50
+SNIPPET_CHARS = 160
+
+def search_tokens(text):
+    return SEARCH_TOKEN_RE.findall(text.lower())
+
+def plain_text(body_md):
+    return re.sub(r"[*_`#>\[\]]+", "", body_md)
+
+class DevlogIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        self.mtimes = {}
+        self.texts = {}
+        self.total_length = 0
+        self.vocabulary = None  # sorted token list for prefix lookups, rebuilt lazily
+
+    def add(self, devlog_id, mtime, text):
+        self.remove(devlog_id)
+        tokens = search_tokens(text)
+        for token, tf in Counter(tokens).items():
+            self.postings[token][devlog_id] = tf
+        self.lengths[devlog_id] = len(tokens)
+        self.total_length += len(tokens)
+        self.mtimes[devlog_id] = mtime
+        self.texts[devlog_id] = text
+        self.vocabulary = None
+
+    def remove(self, devlog_id):
+        if devlog_id not in self.lengths:
+            return
+        for token in set(search_tokens(self.texts[devlog_id])):
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.pop(devlog_id, None)
+                if not docs:
+                    del self.postings[token]
+        self.total_length -= self.lengths.pop(devlog_id)
+        del self.mtimes[devlog_id]
+        del self.texts[devlog_id]
+        self.vocabulary = None
+
+    def sync(self, store):
+        # returns True when something was re-indexed
+        store.scan()
+        changed = False
+        with store.lock:
+            current = {devlog_id: entry for devlog_id, entry in store.entries.items()}
+        for devlog_id, entry in current.items():
+            if self.mtimes.get(devlog_id) != entry["mtime"]:
+                meta = entry["meta"]
+                self.add(devlog_id, entry["mtime"],
+                         f"{meta['title']}\n{meta['summary']}\n{plain_text(entry['body'])}")
+                changed = True
+        for devlog_id in set(self.mtimes) - set(current):
+            self.remove(devlog_id)
+            changed = True
+        return changed
+
+    def expand(self, term):
+        if self.vocabulary is None:
+            self.vocabulary = sorted(self.postings)
+        start = bisect.bisect_left(self.vocabulary, term)
+        matches = []
+        for token in self.vocabulary[start:start + PREFIX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            matches.append((token, 1.0 if token == term else PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query, limit=20):
+        n = len(self.lengths)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1
+        scores = defaultdict(float)
+        matched = defaultdict(set)
+        for term in set(search_tokens(query)):
+            for token, weight in self.expand(term):
+                docs = self.postings[token]
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for devlog_id, tf in docs.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[devlog_id] / avg_length)
+                    scores[devlog_id] += weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    matched[devlog_id].add(token)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(devlog_id, score, self.snippet(devlog_id, matched[devlog_id])) for devlog_id, score in ranked]
+
+    def snippet(self, devlog_id, tokens):
+        text = " ".join(self.texts[devlog_id].split())
+        pattern = re.compile(r"\b(" + "|".join(map(re.escape, sorted(tokens, key=len, reverse=True))) + r")", re.IGNORECASE)
+        first = pattern.search(text)
+        start = max(0, (first.start() if first else 0) - SNIPPET_CHARS // 3)
+        window = text[start:start + SNIPPET_CHARS]
+        pieces, last = [], 0
+        for match in pattern.finditer(window):
+            pieces.append(escape(window[last:match.start()]))
+            pieces.append(Markup("<mark>%s</mark>") % match.group(0))
+            last = match.end()
+        pieces.append(escape(window[last:]))
+        prefix = "…" if start else ""
+        suffix = "…" if start + SNIPPET_CHARS < len(text) else ""
+        return Markup(prefix) + Markup("").join(pieces) + Markup(suffix)
+
+    def save(self, path):
+        data = {
+            "version": DEVLOG_INDEX_VERSION,
+            "postings": self.postings,
+            "lengths": self.lengths,
+            "mtimes": self.mtimes,
+            "texts": self.texts,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+        if data.get("version") != DEVLOG_INDEX_VERSION:
+            return index
+        # JSON turns the integer ids into strings
+        for token, docs in data["postings"].items():
+            index.postings[token] = {int(devlog_id): tf for devlog_id, tf in docs.items()}
+        index.lengths = {int(k): v for k, v in data["lengths"].items()}
+        index.mtimes = {int(k): v for k, v in data["mtimes"].items()}
+        index.texts = {int(k): v for k, v in data["texts"].items()}
+        index.total_length = sum(index.lengths.values())
+        return index
+
+devlog_index = None  # loaded from disk on the first search (or in warm_up())
+devlog_index_lock = threading.Lock()
+
+def get_devlog_index():
+    global devlog_index
+    with devlog_index_lock:
+        if devlog_index is None:
+            devlog_index = DevlogIndex.load(DEVLOG_INDEX_PATH)
+        return devlog_index
+
+def search_devlogs(query, limit=20):
+    devlog_index = get_devlog_index()
+    with devlog_index_lock:
+        if devlog_index.sync(devlog_store):
+            try:
+                devlog_index.save(DEVLOG_INDEX_PATH)
+            except OSError:
+                pass  # a read-only deploy just rebuilds the index in memory
+        with stage("devlog-search"):
+            hits = devlog_index.search(query, limit)
+    results = []
+    for devlog_id, score, snippet in hits:
+        entry = devlog_store.entries.get(devlog_id)
+        if entry is not None:
+            results.append(dict(entry["meta"], score=round(score, 3), snippet=snippet))
+    return results
+
 def load_devlogs():
-    devlogs = []
-    for filename in sorted(os.listdir(DEVLOGS_FOLDER)):
-        if filename.endswith(".md"):
-            filepath = os.path.join(DEVLOGS_FOLDER, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            # Extract header metadata
-            header_match = re.match(r"---\n(.*?)\n---\n(.*)", content, re.DOTALL)
-            if header_match:
-                header_text, body_md = header_match.groups()
-                metadata = {}
-                for line in header_text.split("\n"):
-                    if ":" in line:
-                        key, value = line.split(":", 1)
-                        metadata[key.strip()] = value.strip()
-                devlogs.append({
-                    "id": int(filename.replace(".md", "")),
-                    "title": metadata.get("title", "Untitled"),
-                    "date": metadata.get("date", ""),
-                    "summary": metadata.get("summary", ""),
-                    "content": markdown.markdown(body_md)
-                })
-    return sorted(devlogs, key=lambda d: d["id"])  # sort by ID
+    with stage("load-devlogs"):
+        return [devlog_store.get(d["id"]) for d in devlog_store.list()]
 
 @app.route('/devlogs')
 def devlogs():
-    devlogs_list = load_devlogs()
+    devlogs_list = devlog_store.list()
     return render_template("devlogs.html", title="Journal Devlogs", devlogs=devlogs_list)
 
+@app.route('/devlogs/search')
+def devlog_search():
+    query = request.args.get("q", "").strip()
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    results = search_devlogs(query, limit) if query else []
+    if request.args.get("format") == "json":
+        return jsonify(query=query, results=[dict(r, snippet=str(r["snippet"])) for r in results])
+    return render_template("devlogs.html", title=f"Search: {query}" if query else "Journal Devlogs",
+                           devlogs=results, query=query)
+
 @app.route('/devlogs/<int:devlog_id>')
 def devlog(devlog_id):
-    devlogs_list = load_devlogs()
-    devlog_entry = next((d for d in devlogs_list if d["id"] == devlog_id), None)
+    devlog_entry = devlog_store.get(devlog_id)
     if not devlog_entry:
         abort(404)
     return render_template("devlog_entry.html", title=devlog_entry["title"], devlog=devlog_entry)
 
+# === Static build ===
+# `flask build` renders every GET page to BUILD_DIR with .gz/.br siblings. With
+# PORTFOLIO_PREBUILT=1 the app serves those files directly and only renders
+# dynamically for the interactive POST demos and anything that wasn't built.
+BUILD_DIR = os.path.join(BASE_DIR, "build")
+PREBUILT = os.environ.get("PORTFOLIO_PREBUILT") == "1"
+COMPRESSIBLE = (".html", ".css", ".js", ".json", ".svg", ".txt")
+
+def site_pages():
+    yield "/"
+    for key in PROJECTS:
+        yield f"/project/{key}"
+    yield "/devlogs"
+    for entry in devlog_store.list():
+        yield f"/devlogs/{entry['id']}"
+
+def page_file(path):
+    return os.path.join(path.strip("/"), "index.html")
+
+def precompress(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return  # brotli is optional; .gz still covers every browser
+    with open(path + ".br", "wb") as f:
+        f.write(brotli.compress(data, quality=11))
+
+@app.cli.command("build")
+@click.option("--output", default=BUILD_DIR, show_default=True, type=click.Path(file_okay=False))
+def build_site(output):
+    if os.path.isdir(output):
+        shutil.rmtree(output)
+    shutil.copytree(app.static_folder, os.path.join(output, "static"))
+    client = app.test_client()
+    pages = 0
+    for path in site_pages():
+        response = client.get(path)
+        if response.status_code != 200:
+            raise click.ClickException(f"{path} returned {response.status_code}")
+        target = os.path.join(output, page_file(path))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(response.data)
+        pages += 1
+    for root, _, files in os.walk(output):
+        for name in files:
+            if name.endswith(COMPRESSIBLE):
+                precompress(os.path.join(root, name))
+    click.echo(f"built {pages} pages into {output}")
+
+def prebuilt_variant(path):
+    # best precompressed sibling the client accepts
+    accepted = request.accept_encodings
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if accepted[encoding] and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+def send_prebuilt(path, mimetype=None, max_age=None):
+    variant, encoding = prebuilt_variant(path)
+    stat = os.stat(variant)
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    if encoding:
+        etag += f"-{encoding}"  # each variant is its own representation for caches
+    response = send_file(variant, mimetype=mimetype or mimetypes.guess_type(path)[0],
+                         etag=etag, conditional=True, max_age=max_age)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+@app.before_request
+def serve_prebuilt():
+    if not PREBUILT or request.method not in ("GET", "HEAD"):
+        return None
+    if request.path.startswith("/static/"):
+        path = safe_join(BUILD_DIR, request.path.lstrip("/"))
+        if path and os.path.isfile(path):
+            # fingerprinted URLs never change content
+            return send_prebuilt(path, max_age=FOD_MAX_AGE if request.args.get("v") else None)
+        return None
+    if request.args:
+        return None  # e.g. search queries are always rendered
+    path = safe_join(BUILD_DIR, page_file(request.path))
+    if path and os.path.isfile(path):
+        return send_prebuilt(path, mimetype="text/html")
+    return None
+
+# === Response cache ===
+# WSGI middleware in front of the app: GET pages are rendered once, stored with a
+# strong ETag and gzip/brotli variants, and answered from memory (or with a 304)
+# until the devlogs, PROJECTS or templates change.
+RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+COMPRESS_MIN_BYTES = 512
+CACHEABLE_TYPES = ("text/html", "application/json")
+UNCACHED_PREFIXES = ("/static/", "/fod/")  # these already send their own validators
+NO_STORE_PREFIXES = ("/jobs/", "/metrics")  # always no-store, so don't even look them up
+NO_STORE_PARAMS = ("job",)  # a project page showing a job is no-store too
+
+# PROJECTS is a literal in this file, so it can't change while the process runs
+PROJECTS_FINGERPRINT = hashlib.sha1(json.dumps(PROJECTS, sort_keys=True).encode("utf-8")).hexdigest()
+
+def templates_fingerprint():
+    return max(item.stat().st_mtime_ns for item in os.scandir(os.path.join(app.root_path, app.template_folder)))
+
+def response_cache_token(path):
+    try:
+        media_mtime = os.path.getmtime(MEDIA_MANIFEST_PATH)
+    except OSError:
+        media_mtime = None
+    token = (PROJECTS_FINGERPRINT, templates_fingerprint(), media_mtime)
+    if path.startswith("/devlogs"):
+        devlog_store.scan()
+        token += (devlog_store.generation,)
+    return token
+
+def accepted_encoding(header):
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in accepted:
+            return encoding
+    return None
+
+class ResponseCacheMiddleware:
+    def __init__(self, wsgi_app, max_bytes=RESPONSE_CACHE_BYTES, token=response_cache_token):
+        self.wsgi_app = wsgi_app
+        self.cache = ByteLRU(max_bytes)
+        self.token = token
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        query = environ.get("QUERY_STRING", "")
+        if (environ["REQUEST_METHOD"] not in ("GET", "HEAD") or path.startswith(UNCACHED_PREFIXES + NO_STORE_PREFIXES)
+                or any(part.partition("=")[0] in NO_STORE_PARAMS for part in query.split("&"))):
+            return self.wsgi_app(environ, start_response)
+        started = time.perf_counter()
+        key = (path, query)
+        token = self.token(path)
+        cached = self.cache.get(key)
+        entry = cached[0] if cached is not None and cached[0]["token"] == token else None
+        if entry is None:
+            # render as GET even for HEAD so the stored body is complete
+            render_environ = dict(environ, REQUEST_METHOD="GET")
+            status, headers, body = self.render(render_environ)
+            entry = self.make_entry(status, headers, body, token, render_environ.get("portfolio.route"))
+            if entry is None:
+                start_response(status, headers)
+                return [] if environ["REQUEST_METHOD"] == "HEAD" else [body]
+            self.cache.put(key, entry, sum(len(b) for b, _ in entry["variants"].values()))
+            timing = [value for name, value in headers if name.lower() == "server-timing"]
+            return self.respond(entry, environ, start_response, ", ".join(timing + ['cache;desc="miss"']))
+        elapsed = time.perf_counter() - started
+        perf_metrics.observe("portfolio_cached_response_seconds", elapsed, route=entry["route"])
+        return self.respond(entry, environ, start_response, f'cache;desc="hit";dur={elapsed * 1000:.2f}')
+
+    def render(self, environ):
+        captured = {}
+        chunks = []
+        def capture(status, headers, exc_info=None):
+            captured["status"], captured["headers"] = status, headers
+            return chunks.append
+        app_iter = self.wsgi_app(environ, capture)
+        try:
+            chunks.extend(app_iter)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+        return captured["status"], captured["headers"], b"".join(chunks)
+
+    def make_entry(self, status, headers, body, token, route=None):
+        names = {name.lower(): value for name, value in headers}
+        cache_control = names.get("cache-control", "")
+        if (not status.startswith("200") or not names.get("content-type", "").startswith(CACHEABLE_TYPES)
+                or "set-cookie" in names or "content-encoding" in names or "etag" in names
+                or "no-store" in cache_control or "private" in cache_control):
+            return None
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        variants = {None: (body, f'"{etag}"')}
+        if len(body) >= COMPRESS_MIN_BYTES:
+            variants["gzip"] = (gzip.compress(body, compresslevel=6), f'"{etag}-gzip"')
+            try:
+                import brotli
+                variants["br"] = (brotli.compress(body, quality=5), f'"{etag}-br"')
+            except ImportError:
+                pass
+        kept = [(name, value) for name, value in headers
+                if name.lower() not in ("content-length", "cache-control", "vary", "server-timing")]
+        return {"status": status, "headers": kept, "variants": variants, "token": token,
+                "route": route or "unmatched"}
+
+    def respond(self, entry, environ, start_response, timing=None):
+        encoding = accepted_encoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        body, etag = entry["variants"].get(encoding) or entry["variants"][None]
+        if body is entry["variants"][None][0]:
+            encoding = None
+        validators = [("ETag", etag), ("Vary", "Accept-Encoding"), ("Cache-Control", "no-cache")]
+        if timing:
+            validators.append(("Server-Timing", timing))
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH", "")
+        if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+            start_response("304 Not Modified", validators)
+            return []
+        headers = entry["headers"] + validators + [("Content-Length", str(len(body)))]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        start_response(entry["status"], headers)
+        return [] if environ["REQUEST_METHOD"] == "HEAD" else [body]
+
+response_cache = ResponseCacheMiddleware(app.wsgi_app)
+app.wsgi_app = response_cache
+
+# === Startup ===
+# numpy, Pillow and markdown are imported where they're used, so index and devlog
+# workers never pay for them. A pre-fork server can call warm_up() in the master
+# (or set PORTFOLIO_WARM_UP=1 with --preload) so workers share the loaded pages. Pool
+# children spawned by the app import it too, but never warm up.
+HEAVY_MODULES = ("numpy", "PIL", "markdown", "matplotlib", "requests")
+STARTUP_BUDGET_MS = 400
+
+def warm_up():
+    import numpy
+    import markdown
+    fod_assets.loaded()
+    devlog_store.scan(force=True)
+    get_devlog_index().sync(devlog_store)
+
+def loaded_heavy_modules():
+    return sorted(set(HEAVY_MODULES) & set(sys.modules))
+
+def parse_importtime(stderr):
+    # lines look like "import time:  self [us] | cumulative | imported package"
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        modules.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def profile_import():
+    # a fresh interpreter, so nothing this process already imported hides in the numbers
+    env = dict(os.environ)
+    env.pop("PORTFOLIO_WARM_UP", None)
+    script = "import json, app; print(json.dumps(app.loaded_heavy_modules()))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=BASE_DIR, env=env,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules = parse_importtime(result.stderr)
+    total_ms = next(cumulative for name, _, cumulative in modules if name.strip() == "app") / 1000
+    return modules, total_ms, json.loads(result.stdout.strip().splitlines()[-1])
+
+@app.cli.command("import-report")
+@click.option("--top", default=15, show_default=True, help="How many of the slowest imports to list.")
+@click.option("--budget-ms", default=STARTUP_BUDGET_MS, show_default=True,
+              help="Fail if importing app.py takes longer than this.")
+def import_report(top, budget_ms):
+    try:
+        modules, total_ms, heavy = profile_import()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    top_level = [m for m in modules if not m[0].startswith("  ")]
+    for name, self_us, cumulative_us in sorted(top_level, key=lambda m: -m[2])[:top]:
+        click.echo(f"{cumulative_us / 1000:9.1f} ms  {name.strip()}")
+    click.echo(f"import app: {total_ms:.1f} ms (budget {budget_ms} ms)")
+    click.echo(f"heavy modules loaded at import: {', '.join(heavy) or 'none'}")
+    if total_ms > budget_ms or heavy:
+        raise click.ClickException("startup budget exceeded")
+
+if os.environ.get("PORTFOLIO_WARM_UP") == "1" and multiprocessing.parent_process() is None:
+    warm_up()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,348 @@
+import os
+import sys
+import io
+import json
+import math
+import time
+import random
+import fnmatch
+import platform
+import datetime
+import statistics
+import subprocess
+import tempfile
+from itertools import accumulate
+import click
+
+# === Benchmarks ===
+# `python bench.py` times the hot paths of app.py against synthetic fixtures
+# (generated texts, a devlog folder, a local fact file) and writes the results as
+# JSON. Pass --baseline with an earlier results file to fail on regressions.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCALES = {
+    "quick": {"tokens": (10_000, 100_000), "devlogs": 200, "groups": (3, 8, 12, 25), "old_groups": (3, 6)},
+    "default": {"tokens": (10_000, 100_000, 1_000_000), "devlogs": 2000,
+                "groups": (3, 5, 8, 12, 16, 20, 25, 30), "old_groups": (3, 5, 7, 9)},
+    "full": {"tokens": (10_000, 100_000, 1_000_000, 10_000_000), "devlogs": 5000,
+             "groups": (3, 5, 8, 12, 16, 20, 25, 30), "old_groups": (3, 5, 7, 9)},
+}
+DEFAULT_THRESHOLD = 0.15  # a median 15% slower than the baseline counts as a regression
+VOCABULARY = 50_000
+FIXTURE_SEED = 1234
+
+# === Fixtures ===
+# Everything is generated from a fixed seed, so two runs (or two machines) time
+# exactly the same inputs. Files are reused if the fixture folder already has them.
+class Vocabulary:
+    def __init__(self, rng, size=VOCABULARY):
+        letters = "etaoinshrdlcumwfgypbvkjxqz"
+        words = set()
+        while len(words) < size:
+            length = min(int(rng.expovariate(1 / 5)) + 1, 14)
+            words.add("".join(rng.choices(letters, weights=range(26, 0, -1), k=length)))
+        self.words = sorted(words)
+        rng.shuffle(self.words)
+        # word ranks follow Zipf's law, like natural text
+        self.cum_weights = list(accumulate(1 / (rank + 1) for rank in range(size)))
+
+    def sample(self, rng, count):
+        return rng.choices(self.words, cum_weights=self.cum_weights, k=count)
+
+    def queries(self):
+        # a very common word, a mid-frequency one, a prefix and a multi-word query
+        common, medium = self.words[0], self.words[200]
+        prefix = next(word[:3] for word in self.words[50:] if len(word) > 4)
+        return {"common": common, "medium": medium, "prefix": prefix, "phrase": " ".join(self.words[10:13])}
+
+def write_text(path, rng, vocabulary, tokens):
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        while written < tokens:
+            count = min(100_000, tokens - written)
+            words = vocabulary.sample(rng, count)
+            for i in range(0, count, 12):
+                f.write(" ".join(words[i:i + 12]) + ".\n")
+            written += count
+
+def write_devlogs(folder, rng, vocabulary, count):
+    os.makedirs(folder, exist_ok=True)
+    for devlog_id in range(1, count + 1):
+        paragraphs = [" ".join(vocabulary.sample(rng, rng.randint(40, 120))) for _ in range(rng.randint(2, 8))]
+        with open(os.path.join(folder, f"{devlog_id}.md"), "w", encoding="utf-8") as f:
+            f.write("---\n")
+            f.write(f"title: Devlog {devlog_id} {' '.join(vocabulary.sample(rng, 3))}\n")
+            f.write(f"date: 2025-{devlog_id % 12 + 1:02d}-{devlog_id % 28 + 1:02d}\n")
+            f.write(f"summary: {' '.join(vocabulary.sample(rng, 15))}\n")
+            f.write("---\n\n")
+            f.write(f"__Devlog {devlog_id}__\n\n" + "\n\n".join(paragraphs) + "\n")
+
+def write_facts(path, rng, vocabulary, count=200):
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(count):
+            f.write("Fun Fact: " + " ".join(vocabulary.sample(rng, rng.randint(8, 40))) + ".\n")
+
+def build_fixtures(folder, scale):
+    rng = random.Random(FIXTURE_SEED)
+    vocabulary = Vocabulary(rng)
+    fixtures = {"texts": {}, "devlogs": os.path.join(folder, f"devlogs_{scale['devlogs']}"),
+                "facts": os.path.join(folder, "facts.txt"), "queries": vocabulary.queries()}
+    for tokens in scale["tokens"]:
+        path = os.path.join(folder, f"text_{tokens}.txt")
+        if not os.path.exists(path):
+            write_text(path, random.Random(FIXTURE_SEED + tokens), vocabulary, tokens)
+        fixtures["texts"][tokens] = path
+    if not os.path.isdir(fixtures["devlogs"]):
+        write_devlogs(fixtures["devlogs"], random.Random(FIXTURE_SEED + 1), vocabulary, scale["devlogs"])
+    if not os.path.exists(fixtures["facts"]):
+        write_facts(fixtures["facts"], random.Random(FIXTURE_SEED + 2), vocabulary)
+    return fixtures
+
+# === Timing ===
+# Each case runs once to warm up, then `repeat` samples of `number` calls each,
+# where `number` is picked so a sample lasts at least `min_time`. Results are per call.
+def measure(fn, repeat, min_time, setup=None):
+    if setup:
+        setup()
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter() - start
+    number = max(1, math.ceil(min_time / first)) if first > 0 else 1000
+    samples = []
+    for _ in range(repeat):
+        elapsed = 0.0
+        for _ in range(number):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - start
+        samples.append(elapsed / number)
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "ops_per_sec": 1 / statistics.median(samples) if statistics.median(samples) else None,
+        "number": number,
+        "repeat": repeat,
+    }
+
+# === Cases ===
+# Each case is (name, fn, setup). Setup runs outside the timed region, before every call.
+def secret_santa_cases(app, scale):
+    for n in scale["old_groups"]:
+        yield f"secret_santa/exact_ordered_distribution/n={n}", lambda n=n: app.exact_ordered_distribution(n), None
+    for n in scale["groups"]:
+        yield f"secret_santa/probability_matrix/n={n}", \
+            lambda n=n: app.probability_matrix(n, seed=app.SECRET_SANTA_SEED), None
+    excluded = app.parse_exclusions("A-B, B-C, C-A, D-E", 12, mutual=True)
+    yield "secret_santa/probability_matrix/n=12+exclusions", lambda: app.probability_matrix(12, excluded), None
+
+def hapax_cases(app, fixtures):
+    for tokens, path in fixtures["texts"].items():
+        def analyze(path=path):
+            with open(path, "rb") as f:
+                app.analyze_hapax(f)
+        yield f"hapax/analyze_hapax/tokens={tokens}", analyze, None
+    tokens, path = max(fixtures["texts"].items())
+    with open(path, "rb") as f:
+        rates = app.analyze_hapax(f)
+    yield f"hapax/hapax_chart/tokens={tokens}", lambda: app.hapax_chart(rates), None
+    def all_metrics(path=path):
+        with open(path, "rb") as f:
+            app.analyze_lexical(f, metrics=tuple(app.LEXICAL_METRICS), keep_series=False)
+    yield f"hapax/analyze_lexical_all_metrics/tokens={tokens}", all_metrics, None
+
+def fod_cases(app, fixtures):
+    assets = app.fod_assets.loaded()
+    with open(fixtures["facts"], encoding="utf-8") as f:
+        facts = [line.strip() for line in f if line.strip()]
+    longest = max(facts, key=len)
+    date = datetime.date(2025, 6, 1)
+    image = assets.image_names[0] if assets.image_names else None
+    yield "fod/wrap_text/cold", lambda: assets.wrap_text(longest, app.FOD_FALLBACK_SIZE, app.FOD_TEXT_WIDTH), \
+        assets.word_width.cache_clear
+    yield "fod/wrap_text/warm", lambda: assets.wrap_text(longest, app.FOD_FALLBACK_SIZE, app.FOD_TEXT_WIDTH), None
+    yield "fod/fit_text", lambda: assets.fit_text(longest, app.FOD_TEXT_WIDTH, int(app.FOD_HEIGHT * 0.6)), None
+    yield "fod/render_fod", lambda: app.render_fod(longest, date, image, (40, 80, 120)), None
+    img = app.render_fod(longest, date, image, (40, 80, 120))
+    for ext in app.FOD_FORMATS:
+        yield f"fod/encode_{ext}", lambda ext=ext: app.encode_fod(img, ext), None
+    yield "fod/fact_provider_get", app.fact_provider.get, None
+
+def devlog_cases(app, fixtures):
+    folder = fixtures["devlogs"]
+    def cold_store():
+        app.devlog_store = app.DevlogStore(folder)
+    yield "devlogs/scan/cold", lambda: app.devlog_store.scan(force=True), cold_store
+    yield "devlogs/load_devlogs/cold", app.load_devlogs, cold_store
+    cold_store()
+    app.load_devlogs()
+    yield "devlogs/load_devlogs/warm", app.load_devlogs, None
+    yield "devlogs/index_build", lambda: app.DevlogIndex().sync(app.devlog_store), None
+    app.devlog_index = app.DevlogIndex()
+    app.devlog_index.sync(app.devlog_store)
+    for kind, query in fixtures["queries"].items():
+        yield f"devlogs/search/{kind}", lambda query=query: app.devlog_index.search(query), None
+
+def route_cases(app, fixtures):
+    client = app.app.test_client()
+    assets = app.fod_assets.loaded()
+    with open(fixtures["facts"], encoding="utf-8") as f:
+        fact = f.readline().strip()
+    fod = app.fod_urls(fact, datetime.date(2025, 6, 1), assets.image_names[0] if assets.image_names else None,
+                           (10, 20, 30))
+    with open(fixtures["texts"][min(fixtures["texts"])], "rb") as f:
+        upload = f.read()
+    def get(url):
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return request
+    def post_hapax():
+        response = client.post("/api/hapax?points=500", data={"file": (io.BytesIO(upload), "bench.txt")})
+        assert response.status_code == 200, response.status_code
+    # labels stay stable even though the search term and slide ids come from the fixtures
+    urls = {
+        "/": "/",
+        "/devlogs": "/devlogs",
+        "/devlogs/<id>": "/devlogs/1",
+        "/devlogs/search": f"/devlogs/search?q={fixtures['queries']['medium']}",
+        "/project/secret-santa": "/project/secret-santa",
+        "/project/hapax-analyzer": "/project/hapax-analyzer",
+        "/fod/<id>.png": fod["png"],
+        "/fod/<id>.webp": fod["webp"],
+    }
+    for label, url in urls.items():
+        yield f"routes/GET {label} (cached)", get(url), None
+        yield f"routes/GET {label} (cold)", get(url), invalidate_caches(app)
+    yield "routes/POST /api/hapax", post_hapax, None
+
+def invalidate_caches(app):
+    def invalidate():
+        app.response_cache.invalidate()
+        app.fod_render_cache.clear()
+    return invalidate
+
+SUITES = {
+    "secret_santa": lambda app, fixtures, scale: secret_santa_cases(app, scale),
+    "hapax": lambda app, fixtures, scale: hapax_cases(app, fixtures),
+    "fod": lambda app, fixtures, scale: fod_cases(app, fixtures),
+    "devlogs": lambda app, fixtures, scale: devlog_cases(app, fixtures),
+    "routes": lambda app, fixtures, scale: route_cases(app, fixtures),
+}
+
+# === Baseline comparison ===
+def parse_thresholds(default, overrides):
+    thresholds = []
+    for item in overrides:
+        pattern, sep, value = item.rpartition("=")
+        if not sep or not pattern:
+            raise click.BadParameter(f"expected PATTERN=FRACTION, got {item!r}", param_hint="--threshold-for")
+        thresholds.append((pattern, float(value)))
+    return lambda name: next((value for pattern, value in thresholds if fnmatch.fnmatchcase(name, pattern)), default)
+
+def compare(results, baseline, threshold_for, partial=False):
+    report = {}
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            report[name] = {"status": "new"}
+            continue
+        change = current["median"] / before["median"] - 1 if before["median"] else 0.0
+        limit = threshold_for(name)
+        status = "regressed" if change > limit else "improved" if change < -limit else "ok"
+        report[name] = {"status": status, "baseline": before["median"], "change": change, "threshold": limit}
+    if not partial:
+        for name in baseline.keys() - results.keys():
+            report[name] = {"status": "missing"}
+    return report
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+@click.command()
+@click.option("--scale", type=click.Choice(list(SCALES)), default="default", show_default=True,
+              help="Fixture sizes: quick for CI, full adds the 10M-token text.")
+@click.option("--suite", "suites", multiple=True, type=click.Choice(list(SUITES)), help="Only run these suites.")
+@click.option("--filter", "patterns", multiple=True, help="Only run cases whose name matches this glob.")
+@click.option("--repeat", default=5, show_default=True)
+@click.option("--min-time", default=0.05, show_default=True, help="Seconds each timing sample should last.")
+@click.option("--fixtures", "fixture_dir", type=click.Path(file_okay=False),
+              help="Keep generated fixtures here and reuse them across runs.")
+@click.option("--output", default=os.path.join(BASE_DIR, "bench_output.json"), show_default=True,
+              type=click.Path(dir_okay=False))
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Earlier results to compare against.")
+@click.option("--threshold", default=DEFAULT_THRESHOLD, show_default=True,
+              help="Allowed slowdown of the median, as a fraction.")
+@click.option("--threshold-for", "threshold_overrides", multiple=True,
+              help="Per-case threshold as GLOB=FRACTION, e.g. 'routes/*=0.3'. First match wins.")
+def main(scale, suites, patterns, repeat, min_time, fixture_dir, output, baseline, threshold, threshold_overrides):
+    threshold_for = parse_thresholds(threshold, threshold_overrides)
+    scale_name, scale = scale, SCALES[scale]
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_dir = fixture_dir or tmp
+        os.makedirs(fixture_dir, exist_ok=True)
+        click.echo(f"fixtures in {fixture_dir}", err=True)
+        fixtures = build_fixtures(fixture_dir, scale)
+
+        # the app reads these at import; keep the stubbed fact source and the index file local
+        os.environ["FOD_FACT_SOURCE"] = fixtures["facts"]
+        os.environ.pop("PORTFOLIO_PREBUILT", None)
+        os.environ.pop("PORTFOLIO_WARM_UP", None)
+        sys.path.insert(0, BASE_DIR)
+        import app
+        app.DEVLOG_INDEX_PATH = os.path.join(fixture_dir, "devlog_index.json")
+        app.devlog_store = app.DevlogStore(fixtures["devlogs"])
+
+        results = {}
+        for suite in suites or SUITES:
+            for name, fn, setup in SUITES[suite](app, fixtures, scale):
+                if patterns and not any(fnmatch.fnmatchcase(name, p) for p in patterns):
+                    continue
+                results[name] = measure(fn, repeat, min_time, setup)
+                click.echo(f"{name:<60} {format_seconds(results[name]['median']):>10}", err=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": scale_name,
+            "repeat": repeat,
+            "min_time": min_time,
+        },
+        "results": results,
+    }
+    regressed = []
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(results, json.load(f)["results"], threshold_for,
+                                           partial=bool(suites or patterns))
+        for name, row in sorted(report["comparison"].items()):
+            if "change" in row:
+                click.echo(f"{row['status']:<9} {name:<60} {row['change']:+7.1%} "
+                           f"(limit {row['threshold']:.0%})")
+            else:
+                click.echo(f"{row['status']:<9} {name}")
+        regressed = [name for name, row in report["comparison"].items() if row["status"] == "regressed"]
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    click.echo(f"wrote {len(results)} results to {output}")
+    if regressed:
+        raise click.ClickException(f"{len(regressed)} benchmark(s) regressed")
+
+if __name__ == "__main__":
+    main()
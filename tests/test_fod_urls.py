@@ -0,0 +1,24 @@
+import datetime
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("url", [
+    "/fod/2024-01-01/abc/%C3%A9.png",
+    "/fod/%C3%A9/abc/x.png",
+    "/fod/2024-01-01/%C3%A9%C3%A9%C3%A9%C3%A9%C3%A9%C3%A9%C3%A9%C3%A9%C3%A9%C3%A9/x.png",
+])
+def test_malformed_fod_urls_are_not_found(url):
+    assert app.app.test_client().get(url).status_code == 404
+
+
+def test_fod_spec_round_trips_and_rejects_tampering():
+    date = datetime.date(2024, 1, 1)
+    _, _, date_text, signature, rest = app.fod_urls("A fact.", date, "cat.png", (1, 2, 3))["png"].split("/")
+    payload = rest.rsplit(".", 1)[0]
+    spec = app.decode_fod_spec(date_text, signature, payload)
+    assert (spec["fact"], spec["date"], spec["image"], spec["color"]) == ("A fact.", date, "cat.png", (1, 2, 3))
+    assert app.decode_fod_spec("2024-01-02", signature, payload) is None
+    assert app.decode_fod_spec(date_text, signature, payload + "A") is None
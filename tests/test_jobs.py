@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def gate():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+@pytest.fixture
+def manager(tmp_path, gate):
+    jobs = app.JobManager(folder=str(tmp_path), workers=1, max_pending=2)
+    yield jobs
+    gate.set()
+    jobs.executor.shutdown(wait=True)
+
+
+def blocked(check, gate):
+    gate.wait(10)
+    return {"ok": True}
+
+
+def wait_until_idle(jobs):
+    deadline = time.monotonic() + 10
+    while jobs.local and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not jobs.local
+
+
+def test_rejects_past_max_pending(manager, gate, monkeypatch):
+    manager.submit("demo", blocked, gate)
+    manager.submit("demo", blocked, gate)
+    cleaned = []
+    with pytest.raises(app.JobRejected):
+        manager.admit()
+    with pytest.raises(app.JobRejected):
+        manager.submit("demo", blocked, gate, cleanup=lambda: cleaned.append(1))
+    assert cleaned == [1]
+
+    monkeypatch.setattr(app, "jobs", manager)
+    response = app.app.test_client().post("/project/fact-of-the-day")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(app.JOB_RETRY_AFTER)
+
+
+def test_cancel_queued_job_cleans_up_once(manager, gate, tmp_path):
+    running = manager.submit("demo", blocked, gate)
+    cleaned = []
+    queued = manager.submit("demo", blocked, gate, cleanup=lambda: cleaned.append(1))
+    assert manager.cancel(queued.id).status == "cancelled"
+    assert cleaned == [1]
+    gate.set()
+    wait_until_idle(manager)
+    assert cleaned == [1]
+    # another worker sharing the folder sees the same records
+    reader = app.JobManager(folder=str(tmp_path))
+    assert reader.get(queued.id).status == "cancelled"
+    assert reader.get(running.id).status == "done"
+    assert reader.get(running.id).result == {"ok": True}
+
+
+def test_reader_sees_timeout_after_deadline(manager, gate, tmp_path):
+    job = manager.submit("demo", blocked, gate, timeout=0.2)
+    reader = app.JobManager(folder=str(tmp_path))
+    while reader.get(job.id).status == "queued":
+        time.sleep(0.01)
+    assert reader.get(job.id).status == "running"
+    time.sleep(0.3)
+    late = reader.get(job.id)
+    assert late.status == "timeout"  # the owner is still stuck in the job function
+    assert "0.2 seconds" in late.error
+    gate.set()
+    wait_until_idle(manager)
+    assert reader.get(job.id).status == "timeout"
+
+
+def test_unknown_or_malformed_ids_are_missing(manager):
+    assert manager.get("0" * 32) is None
+    assert manager.get("../secret") is None
@@ -0,0 +1,99 @@
+import gzip
+import os
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    app.response_cache.invalidate()
+    yield app.app.test_client()
+    app.response_cache.invalidate()
+
+
+def cache_counts():
+    return app.response_cache.cache.hits, app.response_cache.cache.misses
+
+
+def test_second_get_is_a_hit_with_the_same_strong_etag(client):
+    first = client.get("/")
+    second = client.get("/")
+    assert first.status_code == second.status_code == 200
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert first.headers["ETag"].startswith('"')  # strong, not W/
+    assert 'cache;desc="miss"' in first.headers["Server-Timing"]
+    assert 'cache;desc="hit"' in second.headers["Server-Timing"]
+    assert first.data == second.data
+
+
+def test_if_none_match_gets_a_304(client):
+    etag = client.get("/").headers["ETag"]
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert client.get("/", headers={"If-None-Match": '"something-else"'}).status_code == 200
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("br, gzip", "br"),
+    ("gzip, deflate", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("br; q=0.0, gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_encoding_follows_accept_encoding(client, accept, expected):
+    if expected == "br":
+        brotli = pytest.importorskip("brotli")
+    identity = client.get("/")
+    response = client.get("/", headers={"Accept-Encoding": accept})
+    assert response.headers.get("Content-Encoding") == expected
+    assert response.headers["Vary"] == "Accept-Encoding"
+    if expected == "br":
+        assert brotli.decompress(response.data) == identity.data
+    elif expected == "gzip":
+        assert gzip.decompress(response.data) == identity.data
+    else:
+        assert response.data == identity.data
+    assert (response.headers["ETag"] == identity.headers["ETag"]) == (expected is None)
+
+
+def test_head_has_headers_but_no_body(client):
+    body = client.get("/").data
+    app.response_cache.invalidate()
+    for _ in range(2):  # rendered for the miss, then served from the cache
+        response = client.head("/")
+        assert response.status_code == 200
+        assert response.data == b""
+        assert response.headers["Content-Length"] == str(len(body))
+
+
+@pytest.mark.parametrize("url", ["/project/secret-santa?job=0123", "/jobs/0123", "/metrics"])
+def test_no_store_urls_bypass_the_cache(client, url):
+    before = cache_counts()
+    for _ in range(2):
+        response = client.get(url)
+        assert "ETag" not in response.headers
+        assert "cache;" not in response.headers.get("Server-Timing", "")
+    assert cache_counts() == before
+    assert not any(path == url.split("?")[0] for path, _ in app.response_cache.cache.entries)
+
+
+def test_devlog_change_changes_the_token(client, tmp_path, monkeypatch):
+    entry = tmp_path / "1.md"
+    entry.write_text("---\ntitle: First\n---\nbody\n", encoding="utf-8")
+    monkeypatch.setattr(app, "devlog_store", app.DevlogStore(str(tmp_path), scan_interval=0))
+    token = app.response_cache_token("/devlogs")
+    first = client.get("/devlogs")
+    assert b"First" in first.data
+    entry.write_text("---\ntitle: Second\n---\nbody\n", encoding="utf-8")
+    stat = entry.stat()
+    os.utime(entry, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert app.response_cache_token("/devlogs") != token
+    second = client.get("/devlogs")
+    assert b"Second" in second.data
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert 'cache;desc="miss"' in second.headers["Server-Timing"]
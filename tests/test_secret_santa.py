@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import app
+
+
+def enumerated_matrix(n, excluded=None):
+    # marginals of the brute-force distribution, conditioned on no dead end
+    distribution = app.exact_ordered_distribution(n, excluded)
+    matrix = np.zeros((n, n))
+    for perm, prob in distribution.items():
+        matrix[np.arange(n), perm] += prob
+    return matrix / sum(distribution.values())
+
+
+@pytest.mark.parametrize("n", range(2, 8))
+def test_dp_matches_enumeration(n):
+    assert np.allclose(app.exact_probability_matrix(n), enumerated_matrix(n), atol=1e-12)
+
+
+@pytest.mark.parametrize("n, text, mutual", [
+    (4, "A-B", False),
+    (5, "A-B, C-D", True),
+    (6, "A-B, B-C, C-A", False),
+    (7, "A-B, C-D, E-F, G-A", True),
+])
+def test_dp_matches_enumeration_with_exclusions(n, text, mutual):
+    excluded = app.parse_exclusions(text, n, mutual)
+    matrix = np.array(app.exact_probability_matrix(n, excluded))
+    assert np.allclose(matrix, enumerated_matrix(n, excluded), atol=1e-12)
+    assert not matrix[excluded].any()
+
+
+def test_dp_chunks_match_single_pass(monkeypatch):
+    expected = app.exact_probability_matrix(12)
+    monkeypatch.setattr(app, "EXACT_CHUNK", 64)
+    assert np.allclose(app.exact_probability_matrix(12), expected, atol=1e-12)
+
+
+def test_sampler_rejects_tight_exclusions_early():
+    # feasible, but the last givers almost never find their one receiver left in the hat
+    n = 100
+    excluded = np.zeros((n, n), dtype=bool)
+    for i in range(10):
+        excluded[90 + i, :] = True
+        excluded[90 + i, i] = False
+    rounds = []
+    with pytest.raises(ValueError, match="almost no valid draws"):
+        app.monte_carlo_probability_matrix(n, excluded, workers=1, seed=0, check=lambda: rounds.append(1))
+    assert len(rounds) <= 3  # of the 10000 rounds the attempt budget allows
+
+
+def test_sampler_still_runs_loose_exclusions():
+    excluded = app.parse_exclusions("A-B, C-D", 30, mutual=True)
+    matrix, stderr = app.monte_carlo_probability_matrix(30, excluded, tolerance=5e-3, workers=1, seed=0)
+    assert np.allclose(np.sum(matrix, axis=1), 1)
+    assert max(max(row) for row in stderr) <= 5e-3
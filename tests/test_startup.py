@@ -0,0 +1,25 @@
+import json
+import os
+import subprocess
+import sys
+
+import app
+
+
+def test_import_loads_no_heavy_modules():
+    modules, total_ms, heavy = app.profile_import()
+    assert heavy == []
+    assert not [name for name, _, _ in modules if name.strip().split(".")[0] in app.HEAVY_MODULES]
+    assert total_ms > 0
+
+
+def test_pool_children_skip_warm_up():
+    # the parent warms up; a spawned job-pool child imports app but must stay lean
+    script = ("import json, app; "
+              "print(json.dumps([app.loaded_heavy_modules(), app.run_in_job_pool(app.loaded_heavy_modules)]))")
+    result = subprocess.run([sys.executable, "-c", script], cwd=app.BASE_DIR, capture_output=True, text=True,
+                            env=dict(os.environ, PORTFOLIO_WARM_UP="1"), timeout=120)
+    assert result.returncode == 0, result.stderr
+    parent, child = json.loads(result.stdout.strip().splitlines()[-1])
+    assert {"numpy", "PIL", "markdown"} <= set(parent)
+    assert child == []